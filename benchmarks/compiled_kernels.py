@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+from src.classification.CompiledTextureFeatures import AVAILABLE, CompiledTextureFeatures
+from src.classification.TextureFeatures import TextureFeatures
+
+
+def skimage_features(image: np.ndarray, features: TextureFeatures) -> np.ndarray:
+    # The original extraction, through skimage (grey* names before 0.19, gray* after)
+    try:
+        from skimage.feature import graycomatrix as comatrix, graycoprops as props
+    except ImportError:
+        from skimage.feature import greycomatrix as comatrix, greycoprops as props
+    from skimage.measure import shannon_entropy
+
+    parameters = features.get_parameters()
+    data = features.quantize(image)
+    glcm = comatrix(data, parameters['distances'], parameters['angles'], parameters['levels'], symmetric=True,
+                    normed=True)
+    return np.concatenate([[sum(i) for i in props(glcm, 'contrast')],
+                           [sum(i) for i in props(glcm, 'homogeneity')],
+                           [shannon_entropy(data)]])
+
+
+def per_roi(extract, rois: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for image in rois:
+            extract(image)
+    return (time.perf_counter() - start) / repeat / len(rois)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=u'Compiled texture kernels against the NumPy and skimage paths')
+    parser.add_argument(u'--rois', type=int, default=32)
+    parser.add_argument(u'--size', type=int, default=128)
+    parser.add_argument(u'--repeat', type=int, default=10)
+    parser.add_argument(u'--seed', type=int, default=0)
+    parser.add_argument(u'--tolerance', type=float, default=1e-9,
+                        help=u'Largest relative difference to skimage accepted before failing')
+    arguments = parser.parse_args()
+
+    rois: list = [synthetic.roi(index % 4, index, arguments.seed, arguments.size) for index in range(arguments.rois)]
+    numpy_features = TextureFeatures()
+    compiled_features = CompiledTextureFeatures()
+
+    if not AVAILABLE:
+        # Same kernels run as plain Python: parity still holds, timings do not mean anything
+        print(u'numba is not installed, the kernels run uncompiled\n')
+        rois = rois[:4]
+        arguments.repeat = 1
+
+    reference = np.array([skimage_features(image, numpy_features) for image in rois])
+    print(u'Parity against skimage greycomatrix / greycoprops / shannon_entropy')
+    mismatches: list = []
+    for name, features in ((u'numpy', numpy_features), (u'compiled', compiled_features)):
+        extracted = np.array([features.extract(image) for image in rois])
+        difference = np.max(np.abs(extracted - reference) / np.maximum(np.abs(reference), 1e-300))
+        flag = u'  MISMATCH' if not difference <= arguments.tolerance else u''
+        print(f'  {name:<9} max relative difference: {difference:.3e}{flag}')
+        if flag:
+            mismatches.append(name)
+
+    if mismatches:
+        print(f'\n{u", ".join(mismatches)} differ from skimage by more than {arguments.tolerance:.0e}', file=sys.stderr)
+        sys.exit(1)
+
+    # The first call compiles (or loads the cached machine code), keep it out of the timings
+    compiled_features.extract(rois[0])
+
+    print(f'\nPer ROI ({arguments.size}x{arguments.size}, {len(rois)} ROIs)')
+    timings: dict = {}
+    for name, features in ((u'skimage', None), (u'numpy', numpy_features), (u'compiled', compiled_features)):
+        extract = features.extract if features is not None else \
+            (lambda image: skimage_features(image, numpy_features))
+        timings[name] = per_roi(extract, rois, arguments.repeat)
+        print(f'  {name:<9} {timings[name] * 1e3:9.3f} ms  {timings[u"skimage"] / timings[name]:6.2f}x skimage')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import time
+
+import numpy as np
+
+from src.classification.CovarianceSolver import CovarianceSolver
+from src.classification.MahalanobisModel import MahalanobisModel
+
+
+def synthetic_features(classes: int, samples: int, width: int, seed: int) -> tuple:
+    # Correlated class clusters with feature scales as uneven as the texture vector (contrast vs entropy)
+    random = np.random.default_rng(seed)
+    scales = np.logspace(-1, 3, width)
+    features: list = []
+    labels: list = []
+    for label in range(classes):
+        mixing = random.normal(size=(width, width)) / np.sqrt(width) + np.eye(width)
+        center = random.normal(size=width) * scales
+        features.append(center + (random.normal(size=(samples, width)) @ mixing) * scales)
+        labels.append(np.full(samples, label))
+    return np.concatenate(features), np.concatenate(labels)
+
+
+def query_latency(model: MahalanobisModel, queries: np.ndarray, repeat: int) -> tuple:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        model.distances(queries[:1])
+    single = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        model.distances(queries)
+    batch = (time.perf_counter() - start) / repeat / len(queries)
+
+    return single, batch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=u'Inverse vs Cholesky Mahalanobis scoring')
+    parser.add_argument(u'--classes', type=int, default=4)
+    parser.add_argument(u'--samples', type=int, default=75)
+    parser.add_argument(u'--width', type=int, default=11)
+    parser.add_argument(u'--queries', type=int, default=1000)
+    parser.add_argument(u'--repeat', type=int, default=200)
+    parser.add_argument(u'--seed', type=int, default=0)
+    arguments = parser.parse_args()
+
+    features, labels = synthetic_features(arguments.classes, arguments.samples, arguments.width, arguments.seed)
+    queries, _ = synthetic_features(arguments.classes, arguments.queries // arguments.classes, arguments.width,
+                                    arguments.seed + 1)
+
+    inverse = MahalanobisModel.fit(features, labels, arguments.classes)
+    cholesky = MahalanobisModel.fit(features, labels, arguments.classes, CovarianceSolver())
+
+    reference = inverse.distances(queries)
+    solved = cholesky.distances(queries)
+    print(u'Parity against np.linalg.inv')
+    print(f'  max relative difference: {np.max(np.abs(solved - reference) / np.abs(reference)):.3e}')
+    print(f'  same predicted class:    {np.mean(reference.argmin(axis=1) == solved.argmin(axis=1)) * 100:.2f} %')
+
+    print(u'\nPer query latency (single query / batched)')
+    for name, model in ((u'inverse', inverse), (u'cholesky', cholesky)):
+        single, batch = query_latency(model, queries, arguments.repeat)
+        print(f'  {name:<9} {single * 1e6:9.2f} us / {batch * 1e6:7.3f} us')
+
+    # Fewer samples than features: the plain inverse breaks, shrinkage still gives a usable model
+    small, small_labels = synthetic_features(arguments.classes, arguments.width // 2, arguments.width, arguments.seed)
+    print(f'\nSingular covariance ({arguments.width // 2} samples, {arguments.width} features)')
+    for name, solver in ((u'inverse', None), (u'ridge', CovarianceSolver(u'ridge')),
+                         (u'ledoit-wolf', CovarianceSolver(u'ledoit-wolf'))):
+        try:
+            model = MahalanobisModel.fit(small, small_labels, arguments.classes, solver)
+            accuracy = np.mean(model.predict(small) == small_labels) * 100
+            print(f'  {name:<12} resubstitution accuracy {accuracy:.2f} %')
+        except np.linalg.LinAlgError as error:
+            print(f'  {name:<12} failed: {error}')
+
+
+if __name__ == '__main__':
+    main()
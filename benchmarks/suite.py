@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks import synthetic
+from src.classification.CompiledTextureFeatures import AVAILABLE as COMPILED_KERNELS, CompiledTextureFeatures
+from src.classification.FeaturePyramid import FeaturePyramid
+from src.classification.ImageClassification import ImageClassification
+from src.classification.TextureFeatures import TextureFeatures
+from src.handler.ImageHandler import ImageHandler
+from src.handler.ImagePipeline import ImagePipeline, Operation
+
+FORMAT_VERSION: int = 1
+
+
+def measure(function, repeat: int, items: int = 1, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        function()
+
+    timings: list = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'median': statistics.median(timings),
+        'min': min(timings),
+        'max': max(timings),
+        'repeat': repeat,
+        'items': items
+    }
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__
+    }
+
+
+def cases(directory: str, arguments: argparse.Namespace) -> list:
+    # (name, function, items per call, repeat), fixtures are generated once before anything is timed
+    paths: list = synthetic.write_dataset(directory, arguments.rois_per_class, arguments.seed)
+    full_field: str = synthetic.write_full_field(os.path.join(directory, u'full_field.png'),
+                                                 arguments.full_field_shape, arguments.seed)
+
+    roi = cv2.imread(paths[0], cv2.IMREAD_GRAYSCALE)
+    texture_features = TextureFeatures()
+    quantized = texture_features.quantize(roi)
+    pyramid = FeaturePyramid()
+
+    trained = ImageClassification()
+    trained.load_images(directory)
+    random.seed(arguments.seed)
+    trained.train()
+    batch: list = paths[::max(1, len(paths) // arguments.batch_size)][:arguments.batch_size]
+    region = cv2.imread(full_field, cv2.IMREAD_GRAYSCALE)[:arguments.density_map_size, :arguments.density_map_size]
+
+    def train() -> None:
+        random.seed(arguments.seed)
+        classifier = ImageClassification()
+        classifier.load_images(directory)
+        classifier.train()
+
+    handler = ImageHandler(full_field)
+
+    def zoom() -> None:
+        # The memo is emptied first, otherwise every repeat after the first is answered from it
+        handler.get_pipeline().clear()
+        handler.zoom_in((64, 64))
+        handler.zoom_out()
+
+    # Operations on the zoomed view, evaluated directly since the pipeline would answer repeats from its memo
+    zoomed = ImageHandler(full_field).zoom_in((64, 64))
+
+    # Only measured where numba is installed, the uncompiled kernels would swamp the run
+    compiled: list = []
+    if COMPILED_KERNELS:
+        compiled_features = CompiledTextureFeatures()
+        compiled_features.extract(roi)
+        compiled.append((u'features/extract_compiled', lambda: compiled_features.extract(roi), 1,
+                         arguments.repeat * 20))
+
+    repeat = arguments.repeat
+    return compiled + [
+        (u'decode/roi', lambda: cv2.imread(paths[0], cv2.IMREAD_GRAYSCALE), 1, repeat * 20),
+        (u'decode/full_field', lambda: cv2.imread(full_field, cv2.IMREAD_GRAYSCALE), 1, repeat),
+        (u'features/quantize', lambda: texture_features.quantize(roi), 1, repeat * 20),
+        (u'features/glcm', lambda: texture_features.co_occurrence(quantized), 1, repeat * 20),
+        (u'features/extract', lambda: texture_features.extract(roi), 1, repeat * 20),
+        (u'features/pyramid', lambda: pyramid.extract(roi), 1, repeat * 5),
+        (u'classification/train', train, len(paths), repeat),
+        (u'classification/single', lambda: trained.classify_single_image(paths[0]), 1, repeat * 20),
+        (u'classification/batch', lambda: list(trained.classify_batch(batch)), len(batch), repeat),
+        (u'classification/density_map', lambda: trained.density_map(region, workers=1), 1, max(1, repeat // 2)),
+        (u'handler/open', lambda: ImageHandler(full_field).close(), 1, repeat),
+        (u'handler/zoom', zoom, 1, repeat),
+        (u'handler/resize', lambda: ImagePipeline.evaluate(zoomed, Operation(u'resize', ((64, 64),))), 1, repeat * 20),
+        (u'handler/quantize', lambda: ImagePipeline.evaluate(zoomed, Operation(u'quantize', (16,))), 1, repeat * 20),
+        (u'handler/equalize', lambda: ImagePipeline.evaluate(zoomed, Operation(u'equalize')), 1, repeat * 20),
+    ]
+
+
+def run(arguments: argparse.Namespace) -> dict:
+    results: dict = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, function, items, repeat in cases(directory, arguments):
+            if arguments.filter and not any(pattern in name for pattern in arguments.filter):
+                continue
+            results[name] = measure(function, repeat, items)
+            print(f'{name:<28} {results[name]["median"] * 1e3:10.3f} ms'
+                  f'  ({results[name]["median"] / items * 1e3:.3f} ms per item)')
+
+    return {
+        'version': FORMAT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'parameters': {
+            'rois_per_class': arguments.rois_per_class,
+            'full_field_shape': list(arguments.full_field_shape),
+            'batch_size': arguments.batch_size,
+            'density_map_size': arguments.density_map_size,
+            'seed': arguments.seed
+        },
+        'results': results
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    # Medians are compared per item, a case regresses when it got slower than the allowed fraction
+    regressions: list = []
+    if current['parameters'] != baseline.get('parameters'):
+        print(u'Warning: the baseline was recorded with different parameters', file=sys.stderr)
+
+    print(f'\n{"case":<28} {"baseline":>12} {"current":>12} {"change":>9}')
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median'] / baseline['results'][name]['items']
+        after = result['median'] / result['items']
+        change = after / before - 1.0 if before > 0 else 0.0
+        flag = u'  REGRESSION' if change > threshold else u''
+        print(f'{name:<28} {before * 1e3:9.3f} ms {after * 1e3:9.3f} ms {change * 100:+8.1f}%{flag}')
+        if change > threshold:
+            regressions.append((name, before, after, change))
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=u'Offline performance suite on synthetic mammograms')
+    parser.add_argument(u'--output', help=u'JSON file receiving the results')
+    parser.add_argument(u'--baseline', help=u'JSON results of a previous run to compare against')
+    parser.add_argument(u'--threshold', type=float, default=0.10, help=u'Allowed slowdown before flagging, 0.10 = 10%%')
+    parser.add_argument(u'--filter', nargs=u'*', help=u'Only run the cases whose name contains one of these')
+    parser.add_argument(u'--repeat', type=int, default=5)
+    parser.add_argument(u'--rois-per-class', type=int, default=50)
+    parser.add_argument(u'--full-field-shape', type=synthetic.parse_shape, default=(4000, 3000), help=u'ROWSxCOLUMNS')
+    parser.add_argument(u'--batch-size', type=int, default=64)
+    parser.add_argument(u'--density-map-size', type=int, default=1024)
+    parser.add_argument(u'--seed', type=int, default=0)
+    arguments = parser.parse_args()
+
+    report = run(arguments)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare(report, json.load(file), arguments.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) slower than {arguments.threshold * 100:.0f}%', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
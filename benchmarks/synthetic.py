@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+# Breast density classes from fatty (BI-RADS I) to extremely dense (BI-RADS IV): brighter tissue, finer grain and
+# more fibrous strands as the class grows
+CLASS_TEXTURES: tuple = (
+    {'mean': 70., 'spread': 18., 'grain': 4.0, 'strands': 2},
+    {'mean': 105., 'spread': 22., 'grain': 2.8, 'strands': 6},
+    {'mean': 140., 'spread': 26., 'grain': 1.8, 'strands': 12},
+    {'mean': 175., 'spread': 30., 'grain': 1.1, 'strands': 20},
+)
+
+
+def texture(random: np.random.Generator, shape: tuple, label: int) -> np.ndarray:
+    parameters = CLASS_TEXTURES[label]
+    tissue = cv2.GaussianBlur(random.normal(0., 1., shape), (0, 0), parameters['grain'])
+    tissue *= parameters['spread'] / max(tissue.std(), 1e-6)
+
+    # Fibroglandular strands, long thin bright lines with a random orientation
+    strands = np.zeros(shape, dtype=np.float32)
+    for _ in range(int(parameters['strands'] * shape[0] * shape[1] / 128 ** 2)):
+        start = random.uniform(0, shape[::-1])
+        angle = random.uniform(0, np.pi)
+        length = random.uniform(20, 80)
+        end = start + length * np.array((np.cos(angle), np.sin(angle)))
+        cv2.line(strands, tuple(int(v) for v in start), tuple(int(v) for v in end), float(random.uniform(10, 30)),
+                 thickness=int(random.integers(1, 3)))
+    strands = cv2.GaussianBlur(strands, (0, 0), 1.0)
+
+    return parameters['mean'] + random.normal(0., 8.) + tissue + strands + random.normal(0., 3., shape)
+
+
+def roi(label: int, index: int, seed: int = 0, size: int = 128) -> np.ndarray:
+    # Every ROI only depends on (seed, label, index), so any subset is generated identically
+    random = np.random.default_rng((seed, label, index))
+    return np.clip(texture(random, (size, size), label), 0, 255).astype(np.uint8)
+
+
+def full_field(shape: tuple = (4000, 3000), seed: int = 0) -> np.ndarray:
+    # Half ellipse breast on the left border over a dark background, with the density drifting between the
+    # classes across the tissue
+    random = np.random.default_rng((seed, len(CLASS_TEXTURES)))
+    rows, columns = shape
+
+    scale = 4
+    small = (rows // scale, columns // scale)
+    layers = np.stack([texture(random, small, label) for label in range(len(CLASS_TEXTURES))])
+
+    drift = cv2.GaussianBlur(random.uniform(0, len(CLASS_TEXTURES) - 1, small), (0, 0), min(small) / 6)
+    drift = (drift - drift.min()) / max(np.ptp(drift), 1e-6) * (len(CLASS_TEXTURES) - 1)
+    lower = np.floor(drift).astype(int).clip(0, len(CLASS_TEXTURES) - 2)
+    weight = drift - lower
+    grid = np.ogrid[0:small[0], 0:small[1]]
+    tissue = (1 - weight) * layers[lower, grid[0], grid[1]] + weight * layers[lower + 1, grid[0], grid[1]]
+
+    tissue = cv2.resize(tissue.astype(np.float32), (columns, rows), interpolation=cv2.INTER_LINEAR)
+    tissue += random.normal(0., 3., shape).astype(np.float32)
+
+    y, x = np.ogrid[0:rows, 0:columns]
+    inside = ((y - rows / 2) / (rows * 0.45)) ** 2 + (x / (columns * 0.85)) ** 2
+    image = np.where(inside <= 1, tissue, 8. + random.normal(0., 2., shape))
+
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def write_dataset(directory: str, rois_per_class: int, seed: int = 0) -> list:
+    # Same layout as the real dataset: one folder per BI-RADS class named 1..4
+    paths: list = []
+    for label in range(len(CLASS_TEXTURES)):
+        folder = os.path.join(directory, str(label + 1))
+        os.makedirs(folder, exist_ok=True)
+        for index in range(rois_per_class):
+            path = os.path.join(folder, f'roi{index:04d}.png')
+            cv2.imwrite(path, roi(label, index, seed))
+            paths.append(path)
+    return paths
+
+
+def write_full_field(filename: str, shape: tuple = (4000, 3000), seed: int = 0) -> str:
+    cv2.imwrite(filename, full_field(shape, seed))
+    return filename
+
+
+def parse_shape(value: str) -> tuple:
+    rows, columns = value.lower().split(u'x')
+    return int(rows), int(columns)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=u'Deterministic synthetic mammogram ROIs and full field images')
+    parser.add_argument(u'directory')
+    parser.add_argument(u'--rois-per-class', type=int, default=100)
+    parser.add_argument(u'--full-fields', type=int, default=1)
+    parser.add_argument(u'--full-field-shape', type=parse_shape, default=(4000, 3000), help=u'ROWSxCOLUMNS')
+    parser.add_argument(u'--seed', type=int, default=0)
+    arguments = parser.parse_args()
+
+    write_dataset(arguments.directory, arguments.rois_per_class, arguments.seed)
+    for index in range(arguments.full_fields):
+        write_full_field(os.path.join(arguments.directory, f'full_field{index:02d}.png'),
+                         arguments.full_field_shape, arguments.seed + index)
+
+
+if __name__ == '__main__':
+    main()
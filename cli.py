@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+import time
+
+STARTED: float = time.perf_counter()
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+# Nothing below imports Qt. The classification modules (numpy, OpenCV) are imported by the commands themselves,
+# so --help and argument errors answer immediately
+
+
+def elapsed() -> float:
+    return time.perf_counter() - STARTED
+
+
+def report_timing(timings: dict) -> None:
+    print(u'  '.join(f'{name} {value * 1e3:.1f} ms' for name, value in timings.items()), file=sys.stderr)
+
+
+def image_paths(sources: list) -> list:
+    from src.classification.ImageDataset import ImageDataset
+
+    paths: list = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in sorted(os.walk(source)):
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(ImageDataset.EXTENSIONS))
+        else:
+            paths.append(source)
+    return paths
+
+
+def build_classifier(arguments: argparse.Namespace):
+    from src.classification.CovarianceSolver import CovarianceSolver
+    from src.classification.Descriptors import DescriptorEngine
+    from src.classification.FeaturePyramid import FeaturePyramid
+    from src.classification.ImageClassification import ImageClassification
+
+    features: dict = None
+    if arguments.pyramid:
+        features = FeaturePyramid().get_parameters()
+    elif arguments.descriptors:
+        features = DescriptorEngine(descriptors=arguments.descriptors).get_parameters()
+
+    return ImageClassification(workers=arguments.workers, cache_directory=arguments.cache,
+                               covariance_solver=CovarianceSolver(arguments.shrinkage), features=features,
+                               kernels=arguments.kernels)
+
+
+def write_table(filename: str, header: list, rows: list) -> None:
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_report(filename: str, report: dict) -> None:
+    # CSV keeps the confusion matrix only, JSON keeps everything
+    if filename.endswith(u'.csv'):
+        matrix: list = report['confusion_matrix']
+        write_table(filename, [u'class'] + [f'predicted_{label + 1}' for label in range(len(matrix))],
+                    [[label + 1] + list(row) for label, row in enumerate(matrix)])
+    else:
+        with open(filename, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+def train(arguments: argparse.Namespace) -> dict:
+    import random
+
+    random.seed(arguments.seed)
+    classifier = build_classifier(arguments)
+    imported = elapsed()
+
+    classifier.load_images(arguments.dataset)
+    if arguments.streaming:
+        classifier.train_streaming()
+    else:
+        classifier.train()
+    classifier.save_model(arguments.model)
+
+    print(classifier.show_confusion_matrix())
+    if arguments.output:
+        write_report(arguments.output, {'confusion_matrix': classifier.get_confusion_matrix(),
+                                        'accuracy': classifier.get_accuracy()})
+
+    return {'imports': imported, 'first result': elapsed()}
+
+
+def evaluate(arguments: argparse.Namespace) -> dict:
+    classifier = build_classifier(arguments)
+    imported = elapsed()
+    classifier.load_images(arguments.dataset)
+
+    if arguments.model:
+        # A saved model measured against a labelled dataset
+        classifier.load_model(arguments.model)
+        classifier.evaluate(classifier.extract_dataset())
+        report: dict = {'confusion_matrix': classifier.get_confusion_matrix(), 'accuracy': classifier.get_accuracy()}
+    else:
+        cross_validation = classifier.cross_validate(arguments.folds, seed=arguments.seed)
+        report = {'confusion_matrix': cross_validation.confusion_matrix.tolist(),
+                  'accuracy': cross_validation.accuracy(),
+                  'fold_accuracies': cross_validation.fold_accuracies().tolist()}
+
+    first_result = elapsed()
+    print(''.join(f"""| {' | '.join(f'{value:02}' for value in row)} |\n""" for row in report['confusion_matrix']) +
+          f"""\nAcurácia: {report['accuracy']:.2f} %""")
+    if arguments.output:
+        write_report(arguments.output, report)
+
+    return {'imports': imported, 'first result': first_result}
+
+
+def classify(arguments: argparse.Namespace) -> dict:
+    from src.classification.ImageClassification import ImageClassification
+
+    classifier = ImageClassification(kernels=arguments.kernels)
+    imported = elapsed()
+    classifier.load_model(arguments.model)
+
+    paths: list = image_paths(arguments.images)
+    header: list = [u'image', u'birads'] + [f'distance_{label + 1}' for label in range(classifier.get_classes())] + \
+        [u'extraction_ms', u'scoring_ms']
+
+    # CSV rows are written as soon as their batch is scored, so long runs can be followed with tail -f
+    as_json: bool = arguments.output is not None and arguments.output.endswith(u'.json')
+    output = open(arguments.output, 'w', newline='') if arguments.output not in (None, u'-') else sys.stdout
+    writer = csv.writer(output)
+    if not as_json:
+        writer.writerow(header)
+
+    rows: list = []
+    first_result: float = None
+    failures: list = []
+
+    def failed(image: str, error: IOError) -> None:
+        failures.append(image)
+        print(error, file=sys.stderr)
+
+    try:
+        for result in classifier.classify_batch(paths, arguments.batch_size, failed):
+            first_result = first_result if first_result is not None else elapsed()
+            row: list = [result.source, result.birads] + [float(value) for value in result.distances] + \
+                [result.extraction_time * 1e3, result.scoring_time * 1e3]
+            if as_json:
+                rows.append(dict(zip(header, row)))
+            else:
+                writer.writerow(row)
+
+        if as_json:
+            json.dump(rows, output, indent=2)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if failures:
+        print(f'{len(failures)} of {len(paths)} images could not be decoded and were skipped', file=sys.stderr)
+    return {'imports': imported, 'first result': first_result if first_result is not None else elapsed()}
+
+
+def pack(arguments: argparse.Namespace) -> dict:
+    from src.classification.ImageDataset import ImageDataset
+
+    dataset = ImageDataset()
+    imported = elapsed()
+
+    dataset.index(arguments.dataset, packed=False)
+    filename = dataset.pack(arguments.output)
+    print(f'{len(dataset)} images packed into {filename} '
+          f'({os.path.getsize(filename) / 2 ** 20:.1f} MiB)')
+
+    return {'imports': imported, 'first result': elapsed()}
+
+
+def serve(arguments: argparse.Namespace) -> dict:
+    import asyncio
+
+    from src.server.InferenceServer import InferenceServer
+
+    server = InferenceServer(arguments.model, arguments.workers, arguments.max_batch, arguments.max_wait / 1e3)
+    address = arguments.unix or f'http://{arguments.host}:{arguments.port}'
+
+    def ready() -> None:
+        print(f'Serving {arguments.model} on {address} with {arguments.workers} worker(s), ready after '
+              f'{elapsed() * 1e3:.1f} ms', file=sys.stderr)
+
+    try:
+        asyncio.run(server.serve(arguments.host, arguments.port, arguments.unix, ready))
+    except KeyboardInterrupt:
+        pass
+
+    return {'uptime': elapsed()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=u'Breast density (BI-RADS) classification without the GUI')
+    parser.add_argument(u'--profile', help=u'Write a Chrome trace of the run to this file')
+    commands = parser.add_subparsers(dest=u'command', required=True)
+
+    def add_kernels_option(command: argparse.ArgumentParser) -> None:
+        command.add_argument(u'--kernels', choices=(u'numpy', u'numba', u'auto'), default=u'numpy',
+                             help=u'Texture feature kernels, numba needs it installed and auto uses it when it is')
+
+    def add_training_options(command: argparse.ArgumentParser) -> None:
+        command.add_argument(u'dataset', help=u'Folder with one sub folder of images per BI-RADS class (1..4)')
+        command.add_argument(u'--workers', type=int, default=1)
+        command.add_argument(u'--cache', help=u'Feature cache folder')
+        command.add_argument(u'--shrinkage', choices=(u'ledoit-wolf', u'ridge'))
+        command.add_argument(u'--pyramid', action=u'store_true', help=u'Multi resolution and quantization features')
+        command.add_argument(u'--descriptors', nargs=u'+',
+                             help=u'Texture descriptors or groups (default, haralick), e.g. haralick lbp entropy')
+        command.add_argument(u'--seed', type=int)
+        add_kernels_option(command)
+        command.add_argument(u'--output', help=u'Confusion matrix as .csv or full report as .json')
+
+    command = commands.add_parser(u'train', help=u'Train on a dataset and save the model')
+    add_training_options(command)
+    command.add_argument(u'--model', required=True, help=u'Model file to write')
+    command.add_argument(u'--streaming', action=u'store_true', help=u'Never hold every feature vector at once')
+    command.set_defaults(function=train)
+
+    command = commands.add_parser(u'evaluate', help=u'Cross validate on a dataset, or test a saved model on it')
+    add_training_options(command)
+    command.add_argument(u'--model', help=u'Saved model to test instead of cross validating')
+    command.add_argument(u'--folds', type=int, default=10)
+    command.set_defaults(function=evaluate)
+
+    command = commands.add_parser(u'classify', help=u'Classify image files or folders with a saved model')
+    command.add_argument(u'images', nargs=u'+')
+    command.add_argument(u'--model', required=True)
+    command.add_argument(u'--batch-size', type=int, default=64)
+    add_kernels_option(command)
+    command.add_argument(u'--output', help=u'Results as .csv or .json, CSV on stdout by default')
+    command.set_defaults(function=classify)
+
+    command = commands.add_parser(u'pack', help=u'Pack a dataset into one memory mapped file read by train and evaluate')
+    command.add_argument(u'dataset', help=u'Folder with one sub folder of images per BI-RADS class (1..4)')
+    command.add_argument(u'--output', help=u'Pack file to write, dataset.pack inside the dataset folder by default')
+    command.set_defaults(function=pack)
+
+    command = commands.add_parser(u'serve', help=u'Keep a model loaded and classify images sent over HTTP')
+    command.add_argument(u'--model', required=True)
+    command.add_argument(u'--host', default=u'127.0.0.1')
+    command.add_argument(u'--port', type=int, default=8080)
+    command.add_argument(u'--unix', help=u'Listen on this Unix socket instead of TCP')
+    command.add_argument(u'--workers', type=int, default=1, help=u'Worker processes, 0 runs batches in the server')
+    command.add_argument(u'--max-batch', type=int, default=32)
+    command.add_argument(u'--max-wait', type=float, default=5.0, help=u'Milliseconds a batch waits to fill up')
+    command.set_defaults(function=serve)
+
+    arguments = parser.parse_args()
+
+    if arguments.profile:
+        from src.profiling.Profiler import PROFILER
+        PROFILER.enable(trace=True)
+
+    timings: dict = arguments.function(arguments)
+    timings['total'] = elapsed()
+    report_timing(timings)
+
+    if arguments.profile:
+        PROFILER.export_chrome_trace(arguments.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class ClassAccumulator:
+    __count: int
+    __mean: np.ndarray
+    __scatter: np.ndarray
+    # Sums of y_i^2 y_j and y_i^2 y_j^2 over the samples y taken from origin, for the fourth moments a Ledoit-Wolf
+    # shrinkage needs. origin is the mean of the first samples so the sums stay small
+    __origin: np.ndarray
+    __cubic: np.ndarray
+    __quartic: np.ndarray = None
+
+    def __init__(self, width: int):
+        self.__count = 0
+        self.__mean = np.zeros(width)
+        self.__scatter = np.zeros((width, width))
+        self.__origin = np.zeros(width)
+        self.__cubic = np.zeros((width, width))
+        self.__quartic = np.zeros((width, width))
+
+    @classmethod
+    def from_features(cls, features: np.ndarray):
+        accumulator = cls(features.shape[1])
+        accumulator.add(features)
+        return accumulator
+
+    @classmethod
+    def from_statistics(cls, count: int, mean: np.ndarray, covariance: np.ndarray):
+        accumulator = cls(len(mean))
+        accumulator.__count = int(count)
+        accumulator.__mean = np.array(mean, dtype=np.float64)
+        accumulator.__scatter = np.array(covariance, dtype=np.float64) * max(1, count - 1)
+        # Nothing is known about the fourth moments
+        accumulator.__quartic = None
+        return accumulator
+
+    @classmethod
+    def from_state(cls, count: int, mean: np.ndarray, scatter: np.ndarray, origin: np.ndarray = None,
+                   cubic: np.ndarray = None, quartic: np.ndarray = None):
+        # Exactly what get_state gave, without the moments a Ledoit-Wolf shrinkage cannot be recomputed
+        accumulator = cls(len(mean))
+        accumulator.__count = int(count)
+        accumulator.__mean = np.array(mean, dtype=np.float64)
+        accumulator.__scatter = np.array(scatter, dtype=np.float64)
+        if quartic is None:
+            accumulator.__quartic = None
+        else:
+            accumulator.__origin = np.array(origin, dtype=np.float64)
+            accumulator.__cubic = np.array(cubic, dtype=np.float64)
+            accumulator.__quartic = np.array(quartic, dtype=np.float64)
+        return accumulator
+
+    def get_state(self) -> dict:
+        # Raw sums add and remove work from, before any regularization
+        state: dict = {'mean': self.__mean, 'scatter': self.__scatter}
+        if self.__quartic is not None:
+            state.update(origin=self.__origin, cubic=self.__cubic, quartic=self.__quartic)
+        return state
+
+    def get_count(self) -> int:
+        return self.__count
+
+    def get_width(self) -> int:
+        return self.__mean.shape[0]
+
+    def get_mean(self) -> np.ndarray:
+        return self.__mean
+
+    def get_covariance(self) -> np.ndarray:
+        return self.__scatter / max(1, self.__count - 1)
+
+    def get_scatter(self) -> np.ndarray:
+        return self.__scatter
+
+    def get_fourth_moments(self) -> np.ndarray:
+        # Sums of (x_i - mean_i)^2 (x_j - mean_j)^2, None when the samples never went through this accumulator
+        if self.__quartic is None:
+            return None
+
+        count = self.__count
+        shift = self.__mean - self.__origin
+        second = self.__scatter + count * np.outer(shift, shift)
+        diagonal = np.diag(second)
+        squared = shift ** 2
+        return (self.__quartic
+                - 2 * self.__cubic * shift[None, :] - 2 * self.__cubic.T * shift[:, None]
+                + diagonal[:, None] * squared[None, :] + squared[:, None] * diagonal[None, :]
+                + 4 * np.outer(shift, shift) * second - 3 * count * np.outer(squared, squared))
+
+    def add(self, features: np.ndarray) -> None:
+        features = np.atleast_2d(features)
+        if self.__count == 0 and features.shape[0] > 0:
+            self.__origin = features.mean(axis=0)
+        self.moments(features, 1.0)
+        self.merge(features)
+
+    def remove(self, features: np.ndarray) -> None:
+        features = np.atleast_2d(features)
+        if features.shape[0] > self.__count:
+            raise ValueError(f'Cannot remove {features.shape[0]} samples from a class with {self.__count}')
+        self.moments(features, -1.0)
+
+        for sample in features:
+            count = self.__count
+            self.__count -= 1
+            if self.__count == 0:
+                self.__mean = np.zeros(self.get_width())
+                self.__scatter = np.zeros((self.get_width(), self.get_width()))
+                if self.__quartic is not None:
+                    self.__cubic = np.zeros((self.get_width(), self.get_width()))
+                    self.__quartic = np.zeros((self.get_width(), self.get_width()))
+                continue
+
+            # Welford step taken backwards
+            self.__mean = (count * self.__mean - sample) / self.__count
+            delta = sample - self.__mean
+            self.__scatter = self.__scatter - np.outer(delta, delta) * (count - 1) / count
+
+    def moments(self, features: np.ndarray, sign: float) -> None:
+        if self.__quartic is None:
+            return
+        shifted = features - self.__origin
+        squared = shifted ** 2
+        self.__cubic = self.__cubic + sign * (squared.T @ shifted)
+        self.__quartic = self.__quartic + sign * (squared.T @ squared)
+
+    def merge(self, features: np.ndarray) -> None:
+        # Chan et al. pairwise combination of the current statistics with those of the batch
+        count = features.shape[0]
+        if count == 0:
+            return
+
+        mean = features.mean(axis=0)
+        centered = features - mean
+        delta = mean - self.__mean
+        total = self.__count + count
+
+        self.__scatter = self.__scatter + centered.T @ centered + np.outer(delta, delta) * self.__count * count / total
+        self.__mean = self.__mean + delta * count / total
+        self.__count = total
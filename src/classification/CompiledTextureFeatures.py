@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import importlib.util
+import warnings
+
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+from .TextureFeatures import TextureFeatures
+
+KERNELS: tuple = (u'numpy', u'numba', u'auto')
+
+# Only looked up here, numba itself takes longer to import than a whole training and is imported on first use
+AVAILABLE: bool = importlib.util.find_spec(u'numba') is not None
+
+_compiled: dict = None
+
+
+def _co_occurrence(image, divisor, row_offsets, column_offsets, counts, histogram):
+    # Quantizes once, straight from the uint8 ROI, then counts every offset into counts[offset, first, second].
+    # First levels are stored premultiplied so a pair index is a single add
+    rows, columns = image.shape
+    levels = histogram.shape[0]
+    first_levels = np.empty((rows, columns), np.int32)
+    second_levels = np.empty((rows, columns), np.int32)
+    for row in range(rows):
+        for column in range(columns):
+            level = int(image[row, column]) // divisor
+            first_levels[row, column] = level * levels
+            second_levels[row, column] = level
+            histogram[level] += 1
+
+    # Neighbouring pixels often form the same pair, alternating between two tables keeps consecutive increments
+    # from waiting on each other
+    tables = np.empty((2, levels * levels), np.int32)
+    for offset in range(row_offsets.shape[0]):
+        d_row, d_column = row_offsets[offset], column_offsets[offset]
+        column_start, column_end = max(0, -d_column), min(columns, columns - d_column)
+        tables[:] = 0
+        even, odd = tables[0], tables[1]
+
+        for row in range(max(0, -d_row), min(rows, rows - d_row)):
+            first = first_levels[row, column_start:column_end]
+            second = second_levels[row + d_row, column_start + d_column:column_end + d_column]
+            column = 0
+            while column + 1 < len(first):
+                even[first[column] + second[column]] += 1
+                odd[first[column + 1] + second[column + 1]] += 1
+                column += 2
+            if column < len(first):
+                even[first[column] + second[column]] += 1
+
+        for i in range(levels):
+            for j in range(levels):
+                counts[offset, i, j] = even[i * levels + j] + odd[i * levels + j]
+
+
+def _properties(counts, angles, contrast, homogeneity):
+    # Symmetric normalized matrix reduced in place, contrast and homogeneity summed over the angles of a distance
+    levels = counts.shape[1]
+    for distance in range(contrast.shape[0]):
+        contrast[distance] = 0.0
+        homogeneity[distance] = 0.0
+
+        for angle in range(angles):
+            offset = distance * angles + angle
+            total = 0.0
+            for i in range(levels):
+                for j in range(levels):
+                    total += counts[offset, i, j]
+            if total == 0:
+                continue
+
+            total *= 2.0
+            for i in range(levels):
+                for j in range(levels):
+                    probability = (counts[offset, i, j] + counts[offset, j, i]) / total
+                    weight = (i - j) * (i - j)
+                    contrast[distance] += probability * weight
+                    homogeneity[distance] += probability / (1.0 + weight)
+
+
+def _entropy(histogram):
+    total = 0.0
+    for count in histogram:
+        total += count
+
+    entropy = 0.0
+    for count in histogram:
+        if count > 0:
+            probability = count / total
+            entropy -= probability * np.log(probability)
+    return entropy / np.log(2)
+
+
+def compiled_kernels() -> dict:
+    # Compiled on first use and cached on disk by numba, without it the same functions run as plain Python
+    global _compiled
+    if _compiled is None:
+        if AVAILABLE:
+            import numba
+            jit = numba.njit(cache=True, nogil=True)
+        else:
+            def jit(function):
+                return function
+
+        _compiled = {
+            u'co_occurrence': jit(_co_occurrence),
+            u'properties': jit(_properties),
+            u'entropy': jit(_entropy)
+        }
+    return _compiled
+
+
+def select_kernels(kernels: str) -> str:
+    if kernels not in KERNELS:
+        raise ValueError(f'Unknown kernels {kernels}, expected one of {", ".join(KERNELS)}')
+    if kernels == u'numpy':
+        return u'numpy'
+    if AVAILABLE:
+        return u'numba'
+
+    if kernels == u'numba':
+        warnings.warn(u'numba is not installed, falling back to the NumPy kernels', RuntimeWarning)
+    return u'numpy'
+
+
+class CompiledTextureFeatures(TextureFeatures):
+    __rowOffsets: np.ndarray
+    __columnOffsets: np.ndarray
+    __divisor: int
+    __levels: int
+    __distanceCount: int
+    __angleCount: int
+
+    def __init__(self, distances: tuple = TextureFeatures.DISTANCES, angles: tuple = TextureFeatures.ANGLES,
+                 levels: int = TextureFeatures.LEVELS):
+        super().__init__(distances, angles, levels)
+        offsets = np.array(self.get_offsets(), dtype=np.int64).reshape((-1, 2))
+        self.__rowOffsets = np.ascontiguousarray(offsets[:, 0])
+        self.__columnOffsets = np.ascontiguousarray(offsets[:, 1])
+        self.__levels = levels
+        self.__divisor = 256 // levels
+        self.__distanceCount = len(tuple(distances))
+        self.__angleCount = len(tuple(angles))
+
+    def attributes(self, image: np.ndarray) -> list:
+        # Other image types keep the NumPy quantization
+        if image.dtype != np.uint8 or image.ndim != 2:
+            return super().attributes(image)
+
+        kernels = compiled_kernels()
+
+        with PROFILER.stage(u'features/co_occurrence'):
+            counts = np.zeros((len(self.__rowOffsets), self.__levels, self.__levels), dtype=np.int64)
+            histogram = np.zeros(self.__levels, dtype=np.int64)
+            kernels[u'co_occurrence'](image, self.__divisor, self.__rowOffsets, self.__columnOffsets, counts,
+                                      histogram)
+
+        with PROFILER.stage(u'features/properties'):
+            contrast, homogeneity = np.empty(self.__distanceCount), np.empty(self.__distanceCount)
+            kernels[u'properties'](counts, self.__angleCount, contrast, homogeneity)
+
+        with PROFILER.stage(u'features/entropy'):
+            entropy = kernels[u'entropy'](histogram)
+
+        return [contrast, homogeneity, entropy]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class CovarianceSolver:
+    SHRINKAGES: tuple = (None, u'ledoit-wolf', u'ridge')
+    JITTERS: tuple = (0.0, 1e-10, 1e-8, 1e-6, 1e-4)
+
+    __shrinkage: str
+    __ridge: float
+
+    def __init__(self, shrinkage: str = None, ridge: float = 1e-3):
+        if shrinkage not in self.SHRINKAGES:
+            raise ValueError(f'Unknown shrinkage {shrinkage}, expected one of {self.SHRINKAGES}')
+
+        self.__shrinkage = shrinkage
+        self.__ridge = ridge
+
+    def get_parameters(self) -> dict:
+        return {'shrinkage': self.__shrinkage, 'ridge': self.__ridge}
+
+    def regularize(self, covariance: np.ndarray, samples: np.ndarray = None, statistics: tuple = None) -> np.ndarray:
+        # Both shrinkages pull towards the diagonal, so features on very different scales are treated alike.
+        # Ledoit-Wolf reads either the samples or their (count, scatter, fourth moments) from an accumulator
+        diagonal = np.diag(np.diag(covariance))
+
+        if self.__shrinkage == u'ridge':
+            return covariance + self.__ridge * diagonal
+
+        if self.__shrinkage == u'ledoit-wolf':
+            if samples is not None:
+                centered = samples - samples.mean(axis=0)
+                statistics = (len(samples), centered.T @ centered, (centered ** 2).T @ (centered ** 2))
+            if statistics is not None and statistics[2] is None:
+                raise ValueError('Ledoit-Wolf shrinkage needs the fourth moments of the samples')
+            if statistics is not None and statistics[0] > 1:
+                intensity = self.ledoit_wolf(*statistics)
+                return (1.0 - intensity) * covariance + intensity * diagonal
+
+        return covariance
+
+    @staticmethod
+    def ledoit_wolf(count: int, scatter: np.ndarray, fourth: np.ndarray) -> float:
+        # Ledoit-Wolf intensity for the correlation matrix of the standardized samples towards identity, from the
+        # centered sums of x_i x_j and x_i^2 x_j^2
+        variance = np.diag(scatter) / count
+        variance = np.where(variance == 0, 1.0, variance)
+
+        correlation = scatter / count / np.sqrt(np.outer(variance, variance))
+        spread = np.sum(fourth / np.outer(variance, variance)) / count - np.sum(correlation ** 2)
+        distance = np.sum((correlation - np.eye(len(variance))) ** 2)
+        if distance == 0:
+            return 0.0
+
+        return float(np.clip(spread / count / distance, 0.0, 1.0))
+
+    def factorize(self, covariance: np.ndarray) -> np.ndarray:
+        # Nearly singular matrices get the smallest diagonal loading that makes them positive definite
+        scale = np.mean(np.diag(covariance)) if covariance.size else 1.0
+        for jitter in self.JITTERS:
+            try:
+                return np.linalg.cholesky(covariance + jitter * scale * np.eye(covariance.shape[0]))
+            except np.linalg.LinAlgError:
+                continue
+
+        raise np.linalg.LinAlgError('Covariance matrix is not positive definite, use a shrinkage')
+
+    @staticmethod
+    def distances(features: np.ndarray, means: np.ndarray, choleskys: np.ndarray) -> np.ndarray:
+        # d(x)^2 = |L^-1 (x - mean)|^2, one triangular solve per class covering every query
+        from scipy.linalg import solve_triangular
+
+        features = np.atleast_2d(features)
+        distances = np.empty((features.shape[0], means.shape[0]))
+        for label, (mean, cholesky) in enumerate(zip(means, choleskys)):
+            whitened = solve_triangular(cholesky, (features - mean).T, lower=True, check_finite=False)
+            distances[:, label] = np.einsum('dn,dn->n', whitened, whitened)
+        return distances
+
+    @staticmethod
+    def inverse(cholesky: np.ndarray) -> np.ndarray:
+        from scipy.linalg import solve_triangular
+
+        inverse_factor = solve_triangular(cholesky, np.eye(cholesky.shape[0]), lower=True, check_finite=False)
+        return inverse_factor.T @ inverse_factor
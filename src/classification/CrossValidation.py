@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from .CovarianceSolver import CovarianceSolver
+from .FeatureStore import FeatureStore
+from .MahalanobisModel import MahalanobisModel
+
+
+class CrossValidationReport(NamedTuple):
+    fold_matrices: np.ndarray
+    confusion_matrix: np.ndarray
+
+    def fold_accuracies(self) -> np.ndarray:
+        totals = self.fold_matrices.sum(axis=(1, 2))
+        return 100.0 * np.trace(self.fold_matrices, axis1=1, axis2=2) / np.maximum(totals, 1)
+
+    def accuracy(self) -> float:
+        return 100.0 * np.trace(self.confusion_matrix) / max(1, self.confusion_matrix.sum())
+
+
+class CrossValidation:
+    __folds: int
+    __stratified: bool
+    __workers: int
+    __random: np.random.Generator
+
+    def __init__(self, folds: int = 10, stratified: bool = True, workers: int = None, seed: int = None):
+        if folds < 2:
+            raise ValueError(f'Cross validation needs at least 2 folds, got {folds}')
+
+        self.__folds = folds
+        self.__stratified = stratified
+        self.__workers = workers
+        self.__random = np.random.default_rng(seed)
+
+    def split(self, labels: np.ndarray) -> list:
+        if len(labels) < self.__folds:
+            raise ValueError(f'Cannot split {len(labels)} samples into {self.__folds} folds')
+
+        assignment = np.empty(len(labels), dtype=np.int64)
+        if self.__stratified:
+            # Dealing the shuffled samples of each class round robin keeps the class ratios in every fold
+            offset: int = 0
+            for label in np.unique(labels):
+                members = self.__random.permutation(np.flatnonzero(labels == label))
+                assignment[members] = (np.arange(len(members)) + offset) % self.__folds
+                offset += len(members)
+        else:
+            order = self.__random.permutation(len(labels))
+            assignment[order] = np.arange(len(labels)) % self.__folds
+
+        return [(np.flatnonzero(assignment != fold), np.flatnonzero(assignment == fold))
+                for fold in range(self.__folds)]
+
+    def evaluate(self, store: FeatureStore, classes: int = None,
+                 solver: CovarianceSolver = None) -> CrossValidationReport:
+        features, labels = store.get_features(), store.get_labels()
+        classes = classes if classes is not None else int(labels.max()) + 1
+        MahalanobisModel.check_counts(np.bincount(labels, minlength=classes)[:classes])
+
+        def run_fold(indexes: tuple) -> np.ndarray:
+            train, test = indexes
+            model = MahalanobisModel.fit(features[train], labels[train], classes, solver)
+            return model.confusion_matrix(features[test], labels[test])
+
+        # Folds share the feature matrix read only, numpy releases the GIL for the heavy parts
+        with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+            fold_matrices = np.array(list(executor.map(run_fold, self.split(labels))))
+
+        return CrossValidationReport(fold_matrices, fold_matrices.sum(axis=0))
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from .TextureFeatures import TextureFeatures
+
+
+class DensityMap(NamedTuple):
+    labels: np.ndarray
+    distances: np.ndarray
+    window: int
+    stride: int
+
+    def birads(self) -> np.ndarray:
+        return self.labels + 1
+
+    def to_image_size(self, shape: tuple) -> np.ndarray:
+        # Every pixel takes the class of the window whose top left corner is the closest one above and left
+        rows = np.minimum(np.arange(shape[0]) // self.stride, self.labels.shape[0] - 1)
+        columns = np.minimum(np.arange(shape[1]) // self.stride, self.labels.shape[1] - 1)
+        return self.labels[rows[:, None], columns[None, :]]
+
+
+class SlidingWindowFeatures:
+    WINDOW: int = 128
+
+    __textureFeatures: TextureFeatures
+    __window: int
+    __stride: int
+    __offsets: list
+    __weights: np.ndarray
+
+    def __init__(self, parameters: dict = None, window: int = WINDOW, stride: int = 16):
+        self.__textureFeatures = TextureFeatures(**(parameters or {}))
+        self.__window = window
+        self.__stride = stride
+
+        parameters = self.__textureFeatures.get_parameters()
+        self.__offsets = [
+            (int(round(np.sin(angle) * distance)), int(round(np.cos(angle) * distance)))
+            for distance in parameters['distances']
+            for angle in parameters['angles']
+        ]
+
+        # Contrast and homogeneity only depend on |i - j|, so each window only needs the
+        # difference marginal of its co-occurrence matrices (levels bins instead of levels^2)
+        difference = np.arange(parameters['levels'])
+        self.__weights = np.stack((difference ** 2., 1. / (1. + difference ** 2)), axis=1)
+
+    def get_grid(self, shape: tuple) -> tuple:
+        return (max(0, (shape[0] - self.__window) // self.__stride + 1),
+                max(0, (shape[1] - self.__window) // self.__stride + 1))
+
+    def column_histograms(self, data: np.ndarray, rows: tuple, offset: tuple = None) -> np.ndarray:
+        # Per column histogram of grey levels (offset None) or of |first - second| for the pixel pairs
+        # whose first pixel lies in the given rows
+        levels = self.__textureFeatures.get_parameters()['levels']
+        start, stop = rows
+
+        if offset is None:
+            values = data[start:stop]
+        else:
+            d_row, d_column = offset
+            column_start, column_end = max(0, -d_column), data.shape[1] - max(0, d_column)
+            values = np.abs(data[start:stop, column_start:column_end] -
+                            data[start + d_row:stop + d_row, column_start + d_column:column_end + d_column])
+
+        columns = values.shape[1]
+        encoded = np.arange(columns) * levels + values
+        return np.bincount(encoded.ravel(), minlength=columns * levels).reshape((columns, levels))
+
+    def window_sums(self, columns: np.ndarray, width: int, windows: int) -> np.ndarray:
+        # Sliding the window one stride adds the entering columns and drops the leaving ones,
+        # done for the whole row of windows at once with a prefix sum
+        prefix = np.zeros((columns.shape[0] + 1, columns.shape[1]), dtype=columns.dtype)
+        np.cumsum(columns, axis=0, out=prefix[1:])
+        starts = np.arange(windows) * self.__stride
+        return prefix[starts + width] - prefix[starts]
+
+    def extract(self, image: np.ndarray) -> np.ndarray:
+        # Returns (window rows, window columns, features) for every window position
+        window, stride = self.__window, self.__stride
+        rows, columns = self.get_grid(image.shape)
+        distances = len(self.__textureFeatures.get_parameters()['distances'])
+        angles = len(self.__offsets) // max(1, distances)
+
+        features = np.zeros((rows, columns, 2 * distances + 1))
+        if rows == 0 or columns == 0:
+            return features
+
+        data = self.__textureFeatures.quantize(image)
+
+        # Column histograms of the current band of rows, moved down one stride at a time
+        histograms: list = [
+            self.column_histograms(data, (max(0, -d_row), window - max(0, d_row)), (d_row, d_column))
+            for d_row, d_column in self.__offsets
+        ]
+        grey_levels = self.column_histograms(data, (0, window))
+
+        for row in range(rows):
+            if row > 0:
+                top = (row - 1) * stride
+                for index, (d_row, d_column) in enumerate(self.__offsets):
+                    leaving, entering = top + max(0, -d_row), top + window - max(0, d_row)
+                    histograms[index] += self.column_histograms(data, (entering, entering + stride), (d_row, d_column))
+                    histograms[index] -= self.column_histograms(data, (leaving, leaving + stride), (d_row, d_column))
+                grey_levels += self.column_histograms(data, (top + window, top + window + stride))
+                grey_levels -= self.column_histograms(data, (top, top + stride))
+
+            for index, (d_row, d_column) in enumerate(self.__offsets):
+                width = window - abs(d_column)
+                pairs = (window - abs(d_row)) * width
+                # Both properties are linear in the counts, so columns are reduced before the window sums
+                sums = self.window_sums(histograms[index] @ self.__weights, width, columns) / pairs
+
+                distance = index // angles
+                features[row, :, distance] += sums[:, 0]
+                features[row, :, distances + distance] += sums[:, 1]
+
+            counts = self.window_sums(grey_levels, window, columns)
+            probabilities = counts / float(window * window)
+            logarithms = np.log2(probabilities, where=probabilities > 0, out=np.zeros_like(probabilities))
+            features[row, :, 2 * distances] = -np.sum(probabilities * logarithms, axis=1)
+
+        return features
+
+
+# Extractor owned by each worker process, built once by the pool initializer
+_workerWindows: SlidingWindowFeatures = None
+
+
+def _initialize_worker(parameters: dict, window: int, stride: int) -> None:
+    global _workerWindows
+    _workerWindows = SlidingWindowFeatures(parameters, window, stride)
+
+
+def _extract_tile(tile: np.ndarray) -> np.ndarray:
+    return _workerWindows.extract(tile)
+
+
+class DensityMapper:
+    __parameters: dict
+    __window: int
+    __stride: int
+    __workers: int
+    __rowsPerTile: int
+
+    def __init__(self, parameters: dict = None, window: int = SlidingWindowFeatures.WINDOW, stride: int = 16,
+                 workers: int = None, rows_per_tile: int = 8):
+        self.__parameters = parameters if parameters is not None else TextureFeatures().get_parameters()
+        self.__window = window
+        self.__stride = stride
+        self.__workers = workers if workers else os.cpu_count() or 1
+        self.__rowsPerTile = max(1, rows_per_tile)
+
+    def extract(self, image: np.ndarray, progress=None) -> np.ndarray:
+        # progress(done, total) is called with the window rows done after every strip, an exception it raises
+        # stops the extraction there
+        windows = SlidingWindowFeatures(self.__parameters, self.__window, self.__stride)
+        rows, _ = windows.get_grid(image.shape)
+
+        # Horizontal strips of whole window rows, each one is walked down incrementally by a worker
+        tiles: list = [
+            image[start * self.__stride:(min(start + self.__rowsPerTile, rows) - 1) * self.__stride + self.__window]
+            for start in range(0, rows, self.__rowsPerTile)
+        ]
+
+        if len(tiles) <= 1 or (self.__workers == 1 and progress is None):
+            return windows.extract(image)
+
+        if self.__workers == 1:
+            results: list = []
+            for tile in tiles:
+                results.append(windows.extract(tile))
+                progress(min(rows, len(results) * self.__rowsPerTile), rows)
+            return np.concatenate(results, axis=0)
+
+        executor = ProcessPoolExecutor(max_workers=min(self.__workers, len(tiles)),
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_initialize_worker,
+                                       initargs=(self.__parameters, self.__window, self.__stride))
+        try:
+            results: list = []
+            for result in executor.map(_extract_tile, tiles):
+                results.append(result)
+                if progress is not None:
+                    progress(min(rows, len(results) * self.__rowsPerTile), rows)
+            return np.concatenate(results, axis=0)
+        finally:
+            # Strips not started yet are dropped when the progress callback stopped the extraction
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def map(self, image: np.ndarray, model, progress=None) -> DensityMap:
+        features = self.extract(image, progress)
+        rows, columns, width = features.shape
+
+        distances = model.distances(features.reshape((rows * columns, width))) if rows * columns \
+            else np.empty((0, model.get_classes()))
+        distances = distances.reshape((rows, columns, -1))
+
+        return DensityMap(np.argmin(distances, axis=2) if distances.size else np.empty((rows, columns), dtype=int),
+                          distances, self.__window, self.__stride)
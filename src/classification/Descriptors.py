@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+from .TextureFeatures import TextureFeatures
+
+
+class Intermediate(NamedTuple):
+    name: str
+    requires: tuple
+    function: Callable
+
+
+class Descriptor(NamedTuple):
+    name: str
+    requires: tuple
+    function: Callable
+    width: int = None
+
+    def size(self, distances: int) -> int:
+        # Co-occurrence descriptors give one value per distance (summed over the angles), the others a fixed width
+        return self.width if self.width is not None else distances
+
+
+INTERMEDIATES: dict = {}
+DESCRIPTORS: dict = {}
+
+GROUPS: dict = {
+    'default': ('contrast', 'homogeneity', 'entropy'),
+    'haralick': ('asm', 'contrast', 'correlation', 'variance', 'homogeneity', 'sum_average', 'sum_variance',
+                 'sum_entropy', 'glcm_entropy', 'difference_variance', 'difference_entropy', 'imc1', 'imc2'),
+}
+
+
+def intermediate(name: str, requires: tuple = ()):
+    def register(function: Callable) -> Callable:
+        INTERMEDIATES[name] = Intermediate(name, tuple(requires), function)
+        return function
+    return register
+
+
+def descriptor(name: str, requires: tuple, width: int = None):
+    def register(function: Callable) -> Callable:
+        DESCRIPTORS[name] = Descriptor(name, tuple(requires), function, width)
+        return function
+    return register
+
+
+def entropy_terms(probabilities: np.ndarray) -> np.ndarray:
+    # p log2 p with 0 log 0 = 0
+    return probabilities * np.log2(probabilities, where=probabilities > 0, out=np.zeros_like(probabilities))
+
+
+@intermediate('quantized')
+def quantized(engine, values: dict) -> np.ndarray:
+    return engine.get_texture_features().quantize(values['image'])
+
+
+@intermediate('histogram', ('quantized',))
+def histogram(engine, values: dict) -> np.ndarray:
+    return engine.get_texture_features().histogram(values['quantized'])
+
+
+@intermediate('glcm', ('quantized',))
+def glcm(engine, values: dict) -> np.ndarray:
+    # Normalized twice like greycomatrix followed by greycoprops, (levels, levels, distances, angles)
+    texture_features = engine.get_texture_features()
+    return texture_features.normalize(texture_features.symmetric(texture_features.counts(values['quantized'])))
+
+
+@intermediate('marginals', ('glcm',))
+def marginals(engine, values: dict) -> dict:
+    # Every sum and difference marginal of all the matrices at once, as (bins, distances * angles) arrays
+    probabilities = values['glcm']
+    levels = probabilities.shape[0]
+    flat = probabilities.reshape((levels * levels, -1))
+    sums, differences, grey_levels = engine.get_projections(levels)
+
+    p_x = probabilities.sum(axis=1).reshape((levels, -1))
+    p_y = probabilities.sum(axis=0).reshape((levels, -1))
+    mean_x = grey_levels @ p_x
+    mean_y = grey_levels @ p_y
+
+    return {
+        'flat': flat,
+        'p_x': p_x,
+        'p_y': p_y,
+        'p_sum': sums.T @ flat,
+        'p_difference': differences.T @ flat,
+        'mean_x': mean_x,
+        'mean_y': mean_y,
+        'deviation_x': np.sqrt(((grey_levels[:, None] - mean_x) ** 2 * p_x).sum(axis=0)),
+        'deviation_y': np.sqrt(((grey_levels[:, None] - mean_y) ** 2 * p_y).sum(axis=0))
+    }
+
+
+@intermediate('lbp')
+def lbp(engine, values: dict) -> np.ndarray:
+    # Rotation invariant uniform LBP (8 neighbours, radius 1): uniform patterns are labelled by their number of
+    # brighter neighbours (0..8), every other pattern shares bin 9. Normalized so image sizes are comparable
+    image = values['image'].astype(np.int32)
+    center = image[1:-1, 1:-1]
+    rows, columns = image.shape
+    neighbours = np.stack([
+        image[1 + d_row:rows - 1 + d_row, 1 + d_column:columns - 1 + d_column] >= center
+        for d_row, d_column in ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+    ])
+
+    transitions = np.sum(neighbours != np.roll(neighbours, 1, axis=0), axis=0)
+    codes = np.where(transitions <= 2, neighbours.sum(axis=0), 9)
+    counts = np.bincount(codes.ravel(), minlength=10).astype(np.float64)
+    return counts / max(1., counts.sum())
+
+
+@descriptor('entropy', ('histogram',), width=1)
+def entropy(engine, values: dict) -> np.ndarray:
+    return np.atleast_1d(TextureFeatures.entropy(values['histogram']))
+
+
+@descriptor('contrast', ('glcm',))
+def contrast(engine, values: dict) -> np.ndarray:
+    return np.array(engine.get_texture_features().contrast(values['glcm']))
+
+
+@descriptor('homogeneity', ('glcm',))
+def homogeneity(engine, values: dict) -> np.ndarray:
+    return np.array(engine.get_texture_features().homogeneity(values['glcm']))
+
+
+@descriptor('dissimilarity', ('marginals',))
+def dissimilarity(engine, values: dict) -> np.ndarray:
+    p_difference = values['marginals']['p_difference']
+    return engine.per_distance(np.arange(p_difference.shape[0]) @ p_difference)
+
+
+@descriptor('asm', ('marginals',))
+def asm(engine, values: dict) -> np.ndarray:
+    return engine.per_distance(np.sum(values['marginals']['flat'] ** 2, axis=0))
+
+
+@descriptor('energy', ('marginals',))
+def energy(engine, values: dict) -> np.ndarray:
+    return engine.per_distance(np.sqrt(np.sum(values['marginals']['flat'] ** 2, axis=0)))
+
+
+@descriptor('correlation', ('marginals',))
+def correlation(engine, values: dict) -> np.ndarray:
+    # Same convention as greycoprops: a matrix without variance is fully correlated
+    marginal = values['marginals']
+    levels = marginal['p_x'].shape[0]
+    _, _, grey_levels = engine.get_projections(levels)
+    products = np.outer(grey_levels, grey_levels).ravel() @ marginal['flat']
+    deviations = marginal['deviation_x'] * marginal['deviation_y']
+    covariance = products - marginal['mean_x'] * marginal['mean_y']
+    correlated = deviations > 1e-15
+    return engine.per_distance(np.where(correlated, covariance / np.where(correlated, deviations, 1.), 1.))
+
+
+@descriptor('variance', ('marginals',))
+def variance(engine, values: dict) -> np.ndarray:
+    return engine.per_distance(values['marginals']['deviation_x'] ** 2)
+
+
+@descriptor('sum_average', ('marginals',))
+def sum_average(engine, values: dict) -> np.ndarray:
+    p_sum = values['marginals']['p_sum']
+    return engine.per_distance(np.arange(p_sum.shape[0]) @ p_sum)
+
+
+@descriptor('sum_variance', ('marginals',))
+def sum_variance(engine, values: dict) -> np.ndarray:
+    # Around the sum average, the usual correction of Haralick's (k - sum entropy)^2
+    p_sum = values['marginals']['p_sum']
+    k = np.arange(p_sum.shape[0])[:, None]
+    return engine.per_distance(np.sum((k - (k * p_sum).sum(axis=0)) ** 2 * p_sum, axis=0))
+
+
+@descriptor('sum_entropy', ('marginals',))
+def sum_entropy(engine, values: dict) -> np.ndarray:
+    return engine.per_distance(-np.sum(entropy_terms(values['marginals']['p_sum']), axis=0))
+
+
+@descriptor('glcm_entropy', ('marginals',))
+def glcm_entropy(engine, values: dict) -> np.ndarray:
+    return engine.per_distance(-np.sum(entropy_terms(values['marginals']['flat']), axis=0))
+
+
+@descriptor('difference_variance', ('marginals',))
+def difference_variance(engine, values: dict) -> np.ndarray:
+    p_difference = values['marginals']['p_difference']
+    k = np.arange(p_difference.shape[0])[:, None]
+    return engine.per_distance(np.sum((k - (k * p_difference).sum(axis=0)) ** 2 * p_difference, axis=0))
+
+
+@descriptor('difference_entropy', ('marginals',))
+def difference_entropy(engine, values: dict) -> np.ndarray:
+    return engine.per_distance(-np.sum(entropy_terms(values['marginals']['p_difference']), axis=0))
+
+
+@intermediate('information', ('marginals',))
+def information(engine, values: dict) -> tuple:
+    # Entropies behind Haralick's two information measures of correlation
+    marginal = values['marginals']
+    levels = marginal['p_x'].shape[0]
+    products = (marginal['p_x'][:, None, :] * marginal['p_y'][None, :, :]).reshape((levels * levels, -1))
+    logarithms = np.log2(products, where=products > 0, out=np.zeros_like(products))
+
+    hxy = -np.sum(entropy_terms(marginal['flat']), axis=0)
+    hxy1 = -np.sum(marginal['flat'] * logarithms, axis=0)
+    hxy2 = -np.sum(products * logarithms, axis=0)
+    hx = -np.sum(entropy_terms(marginal['p_x']), axis=0)
+    hy = -np.sum(entropy_terms(marginal['p_y']), axis=0)
+    return hxy, hxy1, hxy2, hx, hy
+
+
+@descriptor('imc1', ('information',))
+def imc1(engine, values: dict) -> np.ndarray:
+    hxy, hxy1, _, hx, hy = values['information']
+    largest = np.maximum(hx, hy)
+    return engine.per_distance(np.where(largest > 0, (hxy - hxy1) / np.where(largest > 0, largest, 1), 0.))
+
+
+@descriptor('imc2', ('information',))
+def imc2(engine, values: dict) -> np.ndarray:
+    hxy, _, hxy2, _, _ = values['information']
+    return engine.per_distance(np.sqrt(np.clip(1. - np.exp(-2. * (hxy2 - hxy)), 0., None)))
+
+
+@descriptor('lbp', ('lbp',), width=10)
+def lbp_histogram(engine, values: dict) -> np.ndarray:
+    return values['lbp']
+
+
+class DescriptorEngine:
+    __textureFeatures: TextureFeatures
+    __descriptors: tuple
+    __plan: list
+    __projections: dict
+
+    def __init__(self, distances: tuple = TextureFeatures.DISTANCES, angles: tuple = TextureFeatures.ANGLES,
+                 levels: int = TextureFeatures.LEVELS, descriptors: tuple = GROUPS['default']):
+        self.__textureFeatures = TextureFeatures(distances, angles, levels)
+        self.__descriptors = self.expand(descriptors)
+        self.__plan = self.plan(self.__descriptors)
+        self.__projections = {}
+
+    @staticmethod
+    def expand(selection) -> tuple:
+        # Group names are replaced by their members, repeated descriptors only appear once
+        names: list = []
+        for name in ([selection] if isinstance(selection, str) else selection):
+            for member in GROUPS.get(name, (name,)):
+                if member not in DESCRIPTORS:
+                    raise ValueError(f'Unknown descriptor {member}, expected one of {sorted(DESCRIPTORS)} '
+                                     f'or a group of {sorted(GROUPS)}')
+                if member not in names:
+                    names.append(member)
+        return tuple(names)
+
+    @staticmethod
+    def plan(descriptors: tuple) -> list:
+        # Intermediates needed by the selection, each one after those it depends on
+        order: list = []
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            for requirement in INTERMEDIATES[name].requires:
+                visit(requirement)
+            order.append(name)
+
+        for name in descriptors:
+            for requirement in DESCRIPTORS[name].requires:
+                visit(requirement)
+        return order
+
+    def get_parameters(self) -> dict:
+        parameters = self.__textureFeatures.get_parameters()
+        parameters['descriptors'] = self.__descriptors
+        return parameters
+
+    def get_texture_features(self) -> TextureFeatures:
+        return self.__textureFeatures
+
+    def get_descriptors(self) -> tuple:
+        return self.__descriptors
+
+    def get_projections(self, levels: int) -> tuple:
+        # One hot (levels^2, bins) matrices mapping every cell to its i + j and |i - j|, and the grey level values
+        if levels not in self.__projections:
+            i, j = np.indices((levels, levels)).reshape((2, -1))
+            sums = np.zeros((levels * levels, 2 * levels - 1))
+            sums[np.arange(levels * levels), i + j] = 1
+            differences = np.zeros((levels * levels, levels))
+            differences[np.arange(levels * levels), np.abs(i - j)] = 1
+            self.__projections[levels] = (sums, differences, np.arange(levels, dtype=np.float64))
+
+        return self.__projections[levels]
+
+    def per_distance(self, values: np.ndarray) -> np.ndarray:
+        # (distances * angles) values summed over the angles, like contrast and homogeneity
+        return values.reshape((len(self.__textureFeatures.get_parameters()['distances']), -1)).sum(axis=1)
+
+    def size(self) -> int:
+        distances = len(self.__textureFeatures.get_parameters()['distances'])
+        return sum(DESCRIPTORS[name].size(distances) for name in self.__descriptors)
+
+    def names(self) -> list:
+        # Per distance descriptors are suffixed with the distance, fixed width ones with their index
+        distances = self.__textureFeatures.get_parameters()['distances']
+        names: list = []
+        for name in self.__descriptors:
+            width = DESCRIPTORS[name].width
+            if width is None:
+                names += [f'{name} d{distance}' for distance in distances]
+            else:
+                names += [name] if width == 1 else [f'{name} {index}' for index in range(width)]
+        return names
+
+    def attributes(self, image: np.ndarray) -> dict:
+        values: dict = {'image': image}
+        for name in self.__plan:
+            with PROFILER.stage(f'descriptors/{name}'):
+                values[name] = INTERMEDIATES[name].function(self, values)
+
+        with PROFILER.stage(u'descriptors/evaluate'):
+            return {name: DESCRIPTORS[name].function(self, values) for name in self.__descriptors}
+
+    def extract(self, image: np.ndarray) -> np.ndarray:
+        attributes = self.attributes(image)
+        return np.concatenate([attributes[name] for name in self.__descriptors], axis=None)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+class FeatureCache:
+    KEY_SIZE: int = 16
+    MAX_AGE: float = 30 * 24 * 60 * 60
+    # A hit only needs to be written back once its stored time is this old, well before it could be evicted
+    TOUCH_INTERVAL: float = 24 * 60 * 60
+
+    __directory: str
+    __filename: str
+    __maxAge: float
+    __index: dict
+    __keys: list
+    __features: list
+    __lastUsed: list
+    __changed: bool
+
+    def __init__(self, directory: str, parameters: dict, max_age: float = MAX_AGE):
+        self.__directory = directory
+        self.__maxAge = max_age
+
+        # One file per extraction setup, a cached vector is only valid for the parameters that produced it
+        parameters_digest = hashlib.blake2b(json.dumps(parameters, sort_keys=True, default=float).encode(u'utf-8'),
+                                            digest_size=8).hexdigest()
+        self.__filename = os.path.join(directory, f'features-{parameters_digest}.npz')
+
+        self.__index = {}
+        self.__keys = []
+        self.__features = []
+        self.__lastUsed = []
+        self.__changed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self.merge(*self.read())
+
+    def get_file_path(self) -> str:
+        return self.__filename
+
+    def get_directory(self) -> str:
+        return self.__directory
+
+    def get_max_age(self) -> float:
+        return self.__maxAge
+
+    def __len__(self) -> int:
+        return len(self.__index)
+
+    @classmethod
+    def key(cls, filename: str) -> bytes:
+        digest = hashlib.blake2b(digest_size=cls.KEY_SIZE)
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.digest()
+
+    def get(self, key: bytes):
+        position = self.__index.get(key)
+        if position is None:
+            return None
+
+        now = time.time()
+        if now - self.__lastUsed[position] > min(self.TOUCH_INTERVAL, self.__maxAge / 2):
+            self.__changed = True
+        self.__lastUsed[position] = now
+        return self.__features[position]
+
+    def put(self, key: bytes, features: np.ndarray) -> None:
+        position = self.__index.get(key)
+        if position is None:
+            self.__index[key] = len(self.__keys)
+            self.__keys.append(key)
+            self.__features.append(np.array(features, dtype=np.float64))
+            self.__lastUsed.append(time.time())
+        else:
+            self.__features[position] = np.array(features, dtype=np.float64)
+            self.__lastUsed[position] = time.time()
+        self.__changed = True
+
+    def read(self) -> tuple:
+        try:
+            with np.load(self.__filename) as stored:
+                return stored['keys'], stored['features'], stored['last_used']
+        except (OSError, KeyError, ValueError):
+            return np.empty(0, dtype=f'S{self.KEY_SIZE}'), np.empty((0, 0)), np.empty(0)
+
+    def merge(self, keys: np.ndarray, features: np.ndarray, last_used: np.ndarray) -> None:
+        for key, vector, used in zip(keys, features, last_used):
+            key = bytes(key).ljust(self.KEY_SIZE, b'\0')
+            position = self.__index.get(key)
+            if position is None:
+                self.__index[key] = len(self.__keys)
+                self.__keys.append(key)
+                self.__features.append(vector)
+                self.__lastUsed.append(used)
+            elif used > self.__lastUsed[position]:
+                self.__lastUsed[position] = used
+
+    def evict(self) -> None:
+        limit = time.time() - self.__maxAge
+        kept = [i for i, used in enumerate(self.__lastUsed) if used >= limit]
+        if len(kept) == len(self.__keys):
+            return
+
+        self.__keys = [self.__keys[i] for i in kept]
+        self.__features = [self.__features[i] for i in kept]
+        self.__lastUsed = [self.__lastUsed[i] for i in kept]
+        self.__index = {key: i for i, key in enumerate(self.__keys)}
+        self.__changed = True
+
+    def save(self) -> None:
+        if not self.__changed:
+            return
+
+        # Entries written by other runs since this cache was opened are kept
+        self.merge(*self.read())
+        self.evict()
+
+        # Write aside and rename, readers never see a partially written file
+        descriptor, temporary = tempfile.mkstemp(dir=self.__directory, suffix=u'.npz')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                np.savez(file,
+                         keys=np.array(self.__keys, dtype=f'S{self.KEY_SIZE}'),
+                         features=np.array(self.__features, dtype=np.float64).reshape((len(self.__keys), -1)),
+                         last_used=np.array(self.__lastUsed, dtype=np.float64))
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, self.__filename)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        self.__changed = False
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+from .CompiledTextureFeatures import CompiledTextureFeatures, select_kernels
+from .Descriptors import DescriptorEngine
+from .TextureFeatures import TextureFeatures
+
+
+class FeaturePyramid:
+    RESOLUTIONS: tuple = (128, 64, 32)
+    LEVELS: tuple = (256, 32, 16)
+    JOINT_LEVELS: int = 64
+
+    __resolutions: tuple
+    __levels: tuple
+    __distances: int
+    __offsets: int
+    __textureFeatures: dict
+    __differencePlan: dict
+
+    def __init__(self, distances: tuple = TextureFeatures.DISTANCES, angles: tuple = TextureFeatures.ANGLES,
+                 levels: tuple = LEVELS, resolutions: tuple = RESOLUTIONS):
+        self.__levels = tuple(sorted({int(level) for level in np.atleast_1d(levels)}, reverse=True))
+        self.__resolutions = tuple(sorted({int(resolution) for resolution in resolutions}, reverse=True))
+
+        # Coarser quantizations are obtained by merging bins of the finest one, which is only exact
+        # when every grey level count divides the finest one
+        finest = self.__levels[0]
+        if 256 % finest or any(finest % level for level in self.__levels):
+            raise ValueError(f'Grey levels {self.__levels} must divide each other and 256')
+
+        self.__distances = len(distances)
+        self.__offsets = len(distances) * len(angles)
+        self.__textureFeatures = {level: TextureFeatures(distances, angles, level) for level in self.__levels}
+        self.__differencePlan = {}
+
+    def get_parameters(self) -> dict:
+        parameters = self.__textureFeatures[self.__levels[0]].get_parameters()
+        parameters['levels'] = self.__levels
+        parameters['resolutions'] = self.__resolutions
+        return parameters
+
+    def get_combinations(self) -> list:
+        return [(resolution, level) for resolution in self.__resolutions for level in self.__levels]
+
+    def size(self) -> int:
+        return len(self.get_combinations()) * self.__textureFeatures[self.__levels[0]].size()
+
+    def names(self) -> list:
+        names = self.__textureFeatures[self.__levels[0]].names()
+        return [f'{resolution}px {level}l {name}' for resolution, level in self.get_combinations() for name in names]
+
+    @staticmethod
+    def rebin(counts: np.ndarray, levels: int) -> np.ndarray:
+        # Sums blocks of adjacent grey levels, (L,) -> (levels,) or (L, L, ...) -> (levels, levels, ...)
+        factor = counts.shape[0] // levels
+        if factor == 1:
+            return counts
+        if counts.ndim == 1:
+            return counts.reshape((levels, factor)).sum(axis=1)
+        return counts.reshape((levels, factor, levels, factor) + counts.shape[2:]).sum(axis=(1, 3))
+
+    def difference_plan(self, levels: int) -> tuple:
+        # Cells of a (levels, levels) matrix sorted by |i - j| with the start of every difference run
+        if levels not in self.__differencePlan:
+            i, j = np.ogrid[0:levels, 0:levels]
+            difference = np.abs(i - j).ravel()
+            order = np.argsort(difference, kind='stable')
+            self.__differencePlan[levels] = (order, np.searchsorted(difference[order], np.arange(levels)))
+
+        return self.__differencePlan[levels]
+
+    def differences(self, data: np.ndarray, levels: int) -> np.ndarray:
+        # (levels, offsets) histogram of |first - second| taken straight from the pixel pairs, without the
+        # (levels, levels) matrix that is larger than the pairs themselves at fine quantizations
+        plan, total = self.__textureFeatures[levels].pair_plan(data.shape)
+
+        data = data.astype(np.intp, copy=False)
+        pairs = np.empty(total, dtype=np.intp)
+        for first, second, target, shape, block in plan:
+            encoded = pairs[target].reshape(shape)
+            np.subtract(data[first], data[second], out=encoded)
+            np.abs(encoded, out=encoded)
+            if block:
+                encoded += block // levels
+
+        return np.bincount(pairs, minlength=self.__offsets * levels).reshape((self.__offsets, levels)).T
+
+    def marginal(self, counts: np.ndarray) -> np.ndarray:
+        # Same (levels, offsets) difference histogram, summed out of the co-occurrence counts
+        levels, _, distances, angles = counts.shape
+        order, starts = self.difference_plan(levels)
+        return np.add.reduceat(counts.reshape((levels * levels, distances * angles))[order], starts, axis=0)
+
+    def properties(self, marginal: np.ndarray, histogram: np.ndarray) -> list:
+        # Contrast and homogeneity only depend on |i - j|, so the difference marginal is enough
+        levels = marginal.shape[0]
+        weights = np.stack((np.arange(levels) ** 2., 1. / (1. + np.arange(levels) ** 2)))
+
+        totals = marginal.sum(axis=0)
+        totals[totals == 0] = 1
+
+        contrast, homogeneity = (weights @ (marginal / totals)).reshape((2, self.__distances, -1)).sum(axis=2)
+        return [list(contrast), list(homogeneity), TextureFeatures.entropy(histogram)]
+
+    def resolution_buffers(self, image: np.ndarray):
+        # Every resolution is downsampled from the previous one, never again from the full image
+        buffer = image
+        for resolution in self.__resolutions:
+            if buffer.shape != (resolution, resolution):
+                buffer = cv2.resize(buffer, (resolution, resolution), interpolation=cv2.INTER_AREA)
+            yield resolution, buffer
+
+    def attributes(self, image: np.ndarray) -> dict:
+        # {(resolution, levels): [contrast list, homogeneity list, entropy]}, one quantization per resolution
+        finest = self.__levels[0]
+        attributes: dict = {}
+
+        for resolution, buffer in self.resolution_buffers(image):
+            with PROFILER.stage(u'features/quantize'):
+                data = self.__textureFeatures[finest].quantize(buffer)
+                histogram = self.__textureFeatures[finest].histogram(data)
+            counts = None
+
+            for level in self.__levels:
+                histogram = self.rebin(histogram, level)
+
+                # Fine quantizations read the pairs directly, the first small enough one is counted once
+                # and every coarser one merges its bins
+                with PROFILER.stage(u'features/co_occurrence'):
+                    if counts is not None:
+                        counts = self.rebin(counts, level)
+                    elif level <= self.JOINT_LEVELS:
+                        counts = self.__textureFeatures[level].counts(data // (finest // level))
+
+                    marginal = self.marginal(counts) if counts is not None else \
+                        self.differences(data // (finest // level), level)
+
+                with PROFILER.stage(u'features/properties'):
+                    attributes[(resolution, level)] = self.properties(marginal, histogram)
+
+        return attributes
+
+    def extract(self, image: np.ndarray) -> np.ndarray:
+        attributes = self.attributes(image)
+        return np.concatenate([np.concatenate(attributes[combination], axis=None)
+                               for combination in self.get_combinations()])
+
+
+def create_extractor(parameters: dict = None, kernels: str = u'numpy'):
+    # Saved models and worker processes only carry parameters, a resolution list means a pyramid and a descriptor
+    # list a descriptor engine. The compiled kernels only cover the default texture features
+    parameters = parameters if parameters is not None else {}
+    if 'resolutions' in parameters:
+        return FeaturePyramid(**parameters)
+    if 'descriptors' in parameters:
+        return DescriptorEngine(**parameters)
+    if select_kernels(kernels) == u'numba':
+        return CompiledTextureFeatures(**parameters)
+    return TextureFeatures(**parameters)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class FeatureStore:
+    __features: np.ndarray
+    __labels: np.ndarray
+    __paths: list
+    __pathIndex: dict
+    __size: int
+
+    def __init__(self, width: int, capacity: int = 1024):
+        self.__features = np.empty((max(1, capacity), width), dtype=np.float64)
+        self.__labels = np.empty(max(1, capacity), dtype=np.int64)
+        self.__paths = []
+        self.__pathIndex = {}
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def get_width(self) -> int:
+        return self.__features.shape[1]
+
+    def append(self, features: np.ndarray, labels, paths: list = None) -> None:
+        features = np.atleast_2d(features)
+        count = features.shape[0]
+        self.reserve(self.__size + count)
+
+        self.__features[self.__size:self.__size + count] = features
+        self.__labels[self.__size:self.__size + count] = labels
+
+        paths = paths if paths is not None else [None] * count
+        for offset, path in enumerate(paths):
+            if path is not None:
+                self.__pathIndex[path] = self.__size + offset
+        self.__paths.extend(paths)
+
+        self.__size += count
+
+    def reserve(self, capacity: int) -> None:
+        if capacity <= self.__features.shape[0]:
+            return
+
+        # Geometric growth keeps appends amortized constant over one contiguous buffer
+        capacity = max(capacity, 2 * self.__features.shape[0])
+        features = np.empty((capacity, self.get_width()), dtype=np.float64)
+        labels = np.empty(capacity, dtype=np.int64)
+        features[:self.__size] = self.__features[:self.__size]
+        labels[:self.__size] = self.__labels[:self.__size]
+        self.__features = features
+        self.__labels = labels
+
+    def get_features(self) -> np.ndarray:
+        return self.__features[:self.__size]
+
+    def get_labels(self) -> np.ndarray:
+        return self.__labels[:self.__size]
+
+    def get_paths(self) -> list:
+        return self.__paths
+
+    def index_of(self, path: str) -> int:
+        return self.__pathIndex[path]
+
+    def get_class(self, label: int) -> np.ndarray:
+        return self.get_features()[self.get_labels() == label]
+
+    def get_classes(self) -> np.ndarray:
+        return np.unique(self.get_labels())
+
+    def take(self, indexes: np.ndarray):
+        store = FeatureStore(self.get_width(), len(indexes))
+        store.append(self.get_features()[indexes], self.get_labels()[indexes], [self.__paths[i] for i in indexes])
+        return store
+
+    def to_numpy(self) -> tuple:
+        return self.get_features().copy(), self.get_labels().copy()
+
+    def clear(self) -> None:
+        self.__paths = []
+        self.__pathIndex = {}
+        self.__size = 0
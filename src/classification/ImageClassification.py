@@ -1,30 +1,79 @@
 # -*- coding: utf-8 -*-
 
-import os
 import random
+import time
+from typing import NamedTuple, Union
 
 import cv2
 import numpy as np
-from skimage.feature import greycomatrix, greycoprops
-from skimage.measure import shannon_entropy
+
+from ..profiling.Profiler import PROFILER
+from .ClassAccumulator import ClassAccumulator
+from .CovarianceSolver import CovarianceSolver
+from .CrossValidation import CrossValidation, CrossValidationReport
+from .DensityMap import DensityMap, DensityMapper
+from .FeatureCache import FeatureCache
+from .FeaturePyramid import FeaturePyramid, create_extractor
+from .FeatureStore import FeatureStore
+from .ImageDataset import ImageDataset
+from .MahalanobisModel import MahalanobisModel
+from .ModelFile import ModelFile
+from .ParallelExtraction import ParallelFeatureExtractor
+from .TextureFeatures import TextureFeatures
+
+
+class ClassificationResult(NamedTuple):
+    source: str
+    label: int
+    distances: np.ndarray
+    extraction_time: float
+    scoring_time: float
+    features: np.ndarray = None
+
+    @property
+    def birads(self) -> int:
+        return self.label + 1
 
 
 class ImageClassification:
+    PROGRESS_STEP: int = 256
+    # Features shown by readout, the first feature named with each of these endings
+    KEY_FEATURES: tuple = (u'contrast d1', u'homogeneity d1', u'entropy')
+
     __imagesTrain: list[list]
-    __imagesAttributes: list[list]
-    __imagesAttributesTest: list[list]
+    __datasetFeatures: FeatureStore = None
+    __trainFeatures: FeatureStore
+    __testFeatures: FeatureStore
 
-    __mean: list[list]
+    __model: MahalanobisModel = None
+    __accumulators: list = None
+    __covarianceSolver: CovarianceSolver
     __accuracy: float
     __confusionMatrix: list[list]
-    __matrix_covariance: list[list]
-    __inverse_covariance: list[list]
 
-    __entropyMean: list[list]
-    __contrastMean: list[list]
-    __homogeneityMean: list[list]
+    __textureFeatures: Union[TextureFeatures, FeaturePyramid]
+    __kernels: str
+    __parallelExtractor: ParallelFeatureExtractor = None
+    __featureCache: FeatureCache = None
+    __dataset: ImageDataset
+    __progress = None
+
+    def __init__(self, workers: int = 1, chunk_size: int = 16, cache_directory: str = None,
+                 memory_budget: int = ImageDataset.MEMORY_BUDGET, covariance_solver: CovarianceSolver = None,
+                 features: dict = None, kernels: str = u'numpy'):
+        # kernels picks how texture features are computed: numpy, numba (compiled, when installed) or auto
+        self.__kernels = kernels
+        self.__textureFeatures = create_extractor(features, kernels)
+        self.__covarianceSolver = covariance_solver if covariance_solver is not None else CovarianceSolver()
+        self.__dataset = ImageDataset(memory_budget=memory_budget)
+
+        if workers != 1:
+            self.__parallelExtractor = ParallelFeatureExtractor(workers, chunk_size,
+                                                                self.__textureFeatures.get_parameters(), kernels)
+
+        if cache_directory is not None:
+            self.__featureCache = FeatureCache(cache_directory, self.__textureFeatures.get_parameters())
 
-    def __init__(self):
         self.__imagesTrain = [
             [],
             [],
@@ -32,6 +81,9 @@ class ImageClassification:
             []
         ]
 
+        self.__trainFeatures = FeatureStore(self.__textureFeatures.size())
+        self.__testFeatures = FeatureStore(self.__textureFeatures.size())
+
         self.__confusionMatrix = [
             [0, 0, 0, 0],
             [0, 0, 0, 0],
@@ -39,244 +91,376 @@ class ImageClassification:
             [0, 0, 0, 0]
         ]
 
-        self.__mean = [
-            [],
-            [],
-            [],
-            []
-        ]
-
-        self.__matrix_covariance = [
-            [],
-            [],
-            [],
-            []
-        ]
-
-        self.__matrix_covariance = [
-            [],
-            [],
-            [],
-            []
-        ]
-
-        self.__inverse_covariance = [
-            [],
-            [],
-            [],
-            []
-        ]
-
-        self.__imagesAttributes = [
-            [],
-            [],
-            [],
-            []
-        ]
-
-        self.__imagesAttributesTest = [
-            [],
-            [],
-            [],
-            []
-        ]
-
-        self.__entropyMean = [
-            [0],
-            [0],
-            [0],
-            [0]
-        ]
-
-        self.__contrastMean = [
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0]
-        ]
-
-        self.__homogeneityMean = [
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0]
-        ]
-
     def load_images(self, directory_path: str) -> None:
-        for directory in os.listdir(directory_path):
-
-            image_files: str = os.path.join(directory_path, directory)
-            if os.path.isfile(image_files) is False:
-
-                for img in os.listdir(image_files):
-
-                    if img.endswith(u'.png') or img.endswith(u'.tif'):
-                        image_full_path: str = str(image_files + '/' + img).replace('\\', '/')
-                        self.__imagesTrain[int(directory) - 1].append(
-                            (image_full_path, cv2.imread(image_full_path, cv2.IMREAD_GRAYSCALE)))
+        with PROFILER.stage(u'dataset/index'):
+            self.__dataset.index(directory_path)
+
+        if self.__parallelExtractor is not None:
+            packed = self.__dataset.get_packed()
+            self.__parallelExtractor.set_packed(packed.get_filename() if packed is not None else None)
+        self.__imagesTrain = [list(self.__dataset.get_paths(label)) for label in range(self.__dataset.get_classes())]
+        self.__datasetFeatures = None
+
+    def get_classes(self) -> int:
+        return len(self.__imagesTrain)
+
+    def set_progress(self, callback=None) -> None:
+        # callback(done, total) is called as the dataset is extracted, an exception raised by it stops the
+        # extraction and is passed on to the caller
+        self.__progress = callback
+
+    def report_progress(self, done: int, total: int) -> None:
+        if self.__progress is not None:
+            self.__progress(done, total)
+
+    def extract_dataset(self) -> FeatureStore:
+        # Every image of the dataset is extracted once and reused by train and cross validation. With a progress
+        # callback images go in steps so it is called along the way
+        if self.__datasetFeatures is None:
+            total: int = sum(len(paths) for paths in self.__imagesTrain)
+            store = FeatureStore(self.__textureFeatures.size(), total)
+            try:
+                with PROFILER.stage(u'train/extract'):
+                    self.report_progress(0, total)
+                    for label, paths in enumerate(self.__imagesTrain):
+                        step: int = self.PROGRESS_STEP if self.__progress is not None else max(1, len(paths))
+                        for start in range(0, len(paths), step):
+                            chunk: list = paths[start:start + step]
+                            store.append(self.extract_features(chunk), label, chunk)
+                            self.report_progress(len(store), total)
+            finally:
+                # Also when stopped halfway, so workers are shut down and the features extracted so far are cached
+                self.finish_extraction()
+
+            self.__datasetFeatures = store
+
+        return self.__datasetFeatures
+
+    def finish_extraction(self) -> None:
+        if self.__parallelExtractor is not None:
+            self.__parallelExtractor.close()
+
+        if self.__featureCache is not None:
+            self.__featureCache.save()
+
+        # Decoded pixels are not needed once the features are known
+        self.__dataset.release()
 
     def train(self) -> None:
-        image_list: list = []
-        image_list_test: list = []
-
-        for path in self.__imagesTrain:
-            random.shuffle(path)
-
-            self.get_attributes_mean(path, test=False)
-
-            self.__contrastMean[self.__imagesTrain.index(path)] /= round(len(path) * 0.75)
-            self.__homogeneityMean[self.__imagesTrain.index(path)] /= round(len(path) * 0.75)
-            self.__entropyMean[self.__imagesTrain.index(path)] /= round(len(path) * 0.75)
-
-            for imageAttribute in self.__imagesAttributes[self.__imagesTrain.index(path)]:
-                imageAttribute[0] = np.subtract(imageAttribute[0], self.__contrastMean[self.__imagesTrain.index(path)])
-                imageAttribute[1] = np.subtract(imageAttribute[1],
-                                                self.__homogeneityMean[self.__imagesTrain.index(path)])
-                imageAttribute[2] = np.subtract(imageAttribute[2], self.__entropyMean[self.__imagesTrain.index(path)])
-
-            attributes_group = []
-
-            for attributes in self.__imagesAttributes[self.__imagesTrain.index(path)]:
-                image_attribute = np.ndarray(shape=(0, 0))
-
-                for attribute in attributes:
-                    image_attribute = np.concatenate((image_attribute, attribute), axis=None)
-
-                attributes_group.append(image_attribute)
-
-            image_list.append(attributes_group)
-
-        self.__matrix_covariance = [
-            np.cov(np.array(image_list[0]).T),
-            np.cov(np.array(image_list[1]).T),
-            np.cov(np.array(image_list[2]).T),
-            np.cov(np.array(image_list[3]).T)
-        ]
-
-        self.__inverse_covariance = [
-            np.linalg.inv(self.__matrix_covariance[0]),
-            np.linalg.inv(self.__matrix_covariance[1]),
-            np.linalg.inv(self.__matrix_covariance[2]),
-            np.linalg.inv(self.__matrix_covariance[3])
-        ]
-
-        self.__mean = [
-            np.concatenate((self.__contrastMean[0], self.__homogeneityMean[0], self.__entropyMean[0]), axis=None),
-            np.concatenate((self.__contrastMean[1], self.__homogeneityMean[1], self.__entropyMean[1]), axis=None),
-            np.concatenate((self.__contrastMean[2], self.__homogeneityMean[2], self.__entropyMean[2]), axis=None),
-            np.concatenate((self.__contrastMean[3], self.__homogeneityMean[3], self.__entropyMean[3]), axis=None)
-        ]
-
-        for path in self.__imagesTrain:
-
-            self.get_attributes_mean(path, test=True)
-
-            attributes_test_dir = []
-
-            for attributes in self.__imagesAttributesTest[self.__imagesTrain.index(path)]:
-                images_attributes_test = np.ndarray(shape=(0, 0))
-
-                for attribute_test in attributes:
-                    images_attributes_test = np.concatenate((images_attributes_test, attribute_test), axis=None)
-
-                attributes_test_dir.append(images_attributes_test)
-
-            image_list_test.append(attributes_test_dir)
-
-            for i in range(75, 100):
-                diff_attributes_test: list = [
-                    np.subtract(attributes_test_dir[i - 75], self.__mean[0]),
-                    np.subtract(attributes_test_dir[i - 75], self.__mean[1]),
-                    np.subtract(attributes_test_dir[i - 75], self.__mean[2]),
-                    np.subtract(attributes_test_dir[i - 75], self.__mean[3])
-                ]
-
-                distance: list = [
-                    np.dot(np.dot(np.array(diff_attributes_test[0]).T, self.__inverse_covariance[0]),
-                           np.array(diff_attributes_test[0])),
-                    np.dot(np.dot(np.array(diff_attributes_test[1]).T, self.__inverse_covariance[1]),
-                           np.array(diff_attributes_test[1])),
-                    np.dot(np.dot(np.array(diff_attributes_test[2]).T, self.__inverse_covariance[2]),
-                           np.array(diff_attributes_test[2])),
-                    np.dot(np.dot(np.array(diff_attributes_test[3]).T, self.__inverse_covariance[3]),
-                           np.array(diff_attributes_test[3])),
-                ]
-
-                self.__confusionMatrix[self.__imagesTrain.index(path)][distance.index(min(distance))] += 1
-
-        self.__accuracy = 0.0
-        for i in range(0, 4):
-            self.__accuracy += self.__confusionMatrix[i][i]
-
-    def get_attributes_mean(self, path: list, test: bool) -> None:
-        for images in path[:round(len(path) * 0.75)]:
-            image = images[1]
-            data = np.array((image / 8), 'int')
-            g = greycomatrix(data, [1, 2, 4, 8, 16], [0, np.pi / 4, np.pi / 2, 3 * np.pi / 4], levels=32,
-                             normed=True,
-                             symmetric=True)
-
-            contrast = greycoprops(g, 'contrast')
-            contrast = [sum(i) for i in contrast]
-            self.__contrastMean[self.__imagesTrain.index(path)] = np.add(
-                self.__contrastMean[self.__imagesTrain.index(path)],
-                contrast)
-
-            entropy = shannon_entropy(data)
-            self.__entropyMean[self.__imagesTrain.index(path)] = np.add(
-                self.__entropyMean[self.__imagesTrain.index(path)],
-                entropy)
-
-            homogeneity = greycoprops(g, 'homogeneity')
-            homogeneity = [sum(i) for i in homogeneity]
-            self.__homogeneityMean[self.__imagesTrain.index(path)] = np.add(
-                self.__homogeneityMean[self.__imagesTrain.index(path)], homogeneity)
-
-            if test:
-                self.__imagesAttributesTest[self.__imagesTrain.index(path)].append([contrast, homogeneity, entropy])
-            else:
-                self.__imagesAttributes[self.__imagesTrain.index(path)].append([contrast, homogeneity, entropy])
+        store: FeatureStore = self.extract_dataset()
+        labels: np.ndarray = store.get_labels()
+
+        # 75% of every class builds the model, the remaining 25% measures it
+        train_indexes: list = []
+        test_indexes: list = []
+        for label in range(self.get_classes()):
+            members: list = list(np.flatnonzero(labels == label))
+            random.shuffle(members)
+            split: int = round(len(members) * 0.75)
+
+            train_indexes.extend(members[:split])
+            test_indexes.extend(members[split:])
+
+        self.__trainFeatures = store.take(np.array(train_indexes, dtype=np.int64))
+        self.__testFeatures = store.take(np.array(test_indexes, dtype=np.int64))
+
+        with PROFILER.stage(u'train/fit'):
+            self.__model = MahalanobisModel.fit(self.__trainFeatures.get_features(),
+                                                self.__trainFeatures.get_labels(), self.get_classes(),
+                                                self.__covarianceSolver)
+            self.__accumulators = [ClassAccumulator.from_features(self.__trainFeatures.get_class(label))
+                                   for label in range(self.get_classes())]
+
+        with PROFILER.stage(u'train/evaluate'):
+            self.evaluate(self.__testFeatures)
+
+    def train_streaming(self, chunk_size: int = 256) -> None:
+        # Same 75/25 split as train, but features only live one chunk at a time
+        train_paths: list = []
+        test_paths: list = []
+        for paths in self.__imagesTrain:
+            paths = list(paths)
+            random.shuffle(paths)
+            split: int = round(len(paths) * 0.75)
+            train_paths.append(paths[:split])
+            test_paths.append(paths[split:])
+
+        total: int = sum(len(paths) for paths in self.__imagesTrain)
+        done: int = 0
+        self.report_progress(done, total)
+
+        try:
+            self.__accumulators = [ClassAccumulator(self.__textureFeatures.size())
+                                   for _ in range(self.get_classes())]
+            for label, paths in enumerate(train_paths):
+                for start in range(0, len(paths), chunk_size):
+                    chunk: list = paths[start:start + chunk_size]
+                    self.__accumulators[label].add(self.extract_features(chunk))
+                    done += len(chunk)
+                    self.report_progress(done, total)
+
+            self.__model = MahalanobisModel.from_accumulators(self.__accumulators, self.__covarianceSolver)
+
+            confusion_matrix = np.zeros((self.get_classes(), self.get_classes()), dtype=np.int64)
+            for label, paths in enumerate(test_paths):
+                for start in range(0, len(paths), chunk_size):
+                    features = self.extract_features(paths[start:start + chunk_size])
+                    confusion_matrix += self.__model.confusion_matrix(features, np.full(len(features), label))
+                    done += len(features)
+                    self.report_progress(done, total)
+        finally:
+            self.finish_extraction()
+
+        self.__confusionMatrix = confusion_matrix.tolist()
+        self.__accuracy = 100.0 * np.trace(confusion_matrix) / max(1, confusion_matrix.sum())
+
+    def update(self, features: np.ndarray, labels: np.ndarray) -> None:
+        features, labels = np.atleast_2d(features), np.atleast_1d(labels)
+        if self.__accumulators is None:
+            self.__accumulators = [ClassAccumulator(features.shape[1])
+                                   for _ in range(max(self.get_classes(), int(labels.max()) + 1))]
+
+        for label in np.unique(labels):
+            self.__accumulators[label].add(features[labels == label])
+
+        self.__model = MahalanobisModel.from_accumulators(self.__accumulators, self.__covarianceSolver)
+
+    def remove(self, features: np.ndarray, labels: np.ndarray) -> None:
+        if self.__accumulators is None:
+            raise ValueError('The classifier has no samples to remove')
+
+        features, labels = np.atleast_2d(features), np.atleast_1d(labels)
+        for label in np.unique(labels):
+            self.__accumulators[label].remove(features[labels == label])
+
+        self.__model = MahalanobisModel.from_accumulators(self.__accumulators, self.__covarianceSolver)
+
+    def update_images(self, images: list, labels: list) -> None:
+        self.update(np.array([self.__textureFeatures.extract(self.decode(image)) for image in images]),
+                    np.array(labels))
+
+    def evaluate(self, store: FeatureStore) -> None:
+        confusion_matrix: np.ndarray = self.__model.confusion_matrix(store.get_features(), store.get_labels())
+        self.__confusionMatrix = confusion_matrix.tolist()
+        self.__accuracy = 100.0 * np.trace(confusion_matrix) / max(1, len(store))
+
+    def cross_validate(self, folds: int = 10, stratified: bool = True, workers: int = None,
+                       seed: int = None) -> CrossValidationReport:
+        return CrossValidation(folds, stratified, workers, seed).evaluate(self.extract_dataset(), self.get_classes(),
+                                                                          self.__covarianceSolver)
+
+    def get_feature_stores(self) -> tuple:
+        return self.__trainFeatures, self.__testFeatures
+
+    def get_model(self) -> MahalanobisModel:
+        return self.__model
+
+    def get_confusion_matrix(self) -> list[list]:
+        return self.__confusionMatrix
+
+    def get_accuracy(self) -> float:
+        return self.__accuracy
+
+    def extract_features(self, images: list) -> np.ndarray:
+        features = np.empty((len(images), self.__textureFeatures.size()))
+        missing: list = list(range(len(images)))
+
+        if self.__featureCache is not None:
+            keys: list = [self.cache_key(path) for path in images]
+            missing = []
+            for i, key in enumerate(keys):
+                cached = self.__featureCache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    features[i] = cached
+            PROFILER.count(u'cache/hits', len(images) - len(missing))
+            PROFILER.count(u'cache/misses', len(missing))
+
+        if self.__parallelExtractor is None:
+            for i, (_, image) in zip(missing, self.__dataset.stream([images[i] for i in missing])):
+                features[i] = self.__textureFeatures.extract(image)
+        elif missing:
+            features[missing] = self.__parallelExtractor.extract([self.__dataset.locate(images[i]) for i in missing])
+
+        if self.__featureCache is not None:
+            for i in missing:
+                self.__featureCache.put(keys[i], features[i])
+
+        return features
+
+    def cache_key(self, path: str) -> bytes:
+        # Packed images keep the key of the file they came from, so cached features survive packing
+        key = self.__dataset.get_key(path)
+        return key if key is not None else FeatureCache.key(path)
 
     def classify_single_image(self, filename: str) -> str:
-        image = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
-        data = np.array((image / 8), 'int')
-        grey_matrix = greycomatrix(data, [1, 2, 4, 8, 16], [0, np.pi / 4, np.pi / 2, 3 * np.pi / 4], levels=32,
-                                   normed=True,
-                                   symmetric=True)
-
-        contrast = greycoprops(grey_matrix, 'contrast')
-        contrast = [sum(i) for i in contrast]
-
-        entropy = shannon_entropy(data)
-
-        homogeneity = greycoprops(grey_matrix, 'homogeneity')
-        homogeneity = [sum(i) for i in homogeneity]
-
-        attributes_image = np.concatenate((contrast, homogeneity, entropy), axis=None)
-
-        diff_attributes: list = [
-            np.subtract(attributes_image, self.__mean[0]),
-            np.subtract(attributes_image, self.__mean[1]),
-            np.subtract(attributes_image, self.__mean[2]),
-            np.subtract(attributes_image, self.__mean[3])
-        ]
-
-        distance: list[list] = [
-            np.dot(np.dot(np.array(diff_attributes[0]).T, self.__inverse_covariance[0]), np.array(diff_attributes[0])),
-            np.dot(np.dot(np.array(diff_attributes[1]).T, self.__inverse_covariance[1]), np.array(diff_attributes[1])),
-            np.dot(np.dot(np.array(diff_attributes[2]).T, self.__inverse_covariance[2]), np.array(diff_attributes[2])),
-            np.dot(np.dot(np.array(diff_attributes[3]).T, self.__inverse_covariance[3]), np.array(diff_attributes[3]))
-        ]
-
-        return f'\n\nClass BIRADS: {distance.index(min(distance))+1:.0f}\n\n'
+        return self.describe(next(self.classify_batch([filename])))
+
+    def classify_array(self, image: np.ndarray) -> ClassificationResult:
+        return next(self.classify_batch([self.to_grayscale(image)]))
+
+    def density_map(self, image: np.ndarray, stride: int = 16, workers: int = None, progress=None) -> DensityMap:
+        # progress(done, total) follows the rows of windows, it is passed here rather than set with set_progress
+        # since the interface maps with the classifier it also classifies with
+        if not isinstance(self.__textureFeatures, TextureFeatures):
+            raise ValueError('Density maps need a single resolution texture model')
+
+        mapper = DensityMapper(self.__textureFeatures.get_parameters(), stride=stride, workers=workers)
+        return mapper.map(self.to_grayscale(image), self.__model, progress)
+
+    @staticmethod
+    def to_grayscale(image: np.ndarray) -> np.ndarray:
+        # 8 or 16 bit unsigned pixels only, 16 bit ones keep their high byte as cv2.IMREAD_GRAYSCALE does
+        image = np.asarray(image)
+        if not ImageClassification.is_grey_dtype(image.dtype):
+            raise ValueError(f'Expected 8 or 16 bit unsigned pixels, got {image.dtype}')
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+        if image.dtype != np.uint8:
+            image = (image.astype(np.uint32) >> 8).astype(np.uint8)
+        return image
+
+    @staticmethod
+    def is_grey_dtype(dtype: np.dtype) -> bool:
+        return dtype.kind == 'u' and dtype.itemsize <= 2
+
+    @staticmethod
+    def describe(result: ClassificationResult) -> str:
+        return f'\n\nClass BIRADS: {result.birads:.0f}\n\n'
+
+    def get_feature_names(self) -> list:
+        return self.__textureFeatures.names()
+
+    def readout(self, result: ClassificationResult) -> str:
+        # One line summary for the live view: class, distance to every class and the key texture features
+        names: list = self.get_feature_names()
+        key: list = []
+        for ending in self.KEY_FEATURES:
+            index = next((i for i, name in enumerate(names) if name.endswith(ending)), None)
+            if index is not None:
+                key.append(f'{ending} {result.features[index]:.3g}')
+
+        distances = u' '.join(f'{distance:.1f}' for distance in result.distances)
+        features = u', '.join(key)
+        milliseconds = (result.extraction_time + result.scoring_time) * 1e3
+        return f'BI-RADS {result.birads}  |  Distances {distances}  |  {features}  |  {milliseconds:.1f} ms'
+
+    def classify_batch(self, images: list, batch_size: int = 64, failed=None):
+        # Images may be file names or grey level arrays, results are yielded as each batch is scored. With
+        # failed(image, error) given, images that cannot be decoded are reported to it and skipped instead of raising
+        for start in range(0, len(images), batch_size):
+            batch: list = images[start:start + batch_size]
+
+            extraction_start = time.perf_counter()
+            decoded: list = []
+            for image in batch:
+                try:
+                    decoded.append((image, self.decode(image)))
+                except IOError as error:
+                    if failed is None:
+                        raise
+                    failed(image, error)
+            if not decoded:
+                continue
+
+            batch = [image for image, _ in decoded]
+            with PROFILER.stage(u'classify/extract'):
+                features = np.array([self.__textureFeatures.extract(pixels) for _, pixels in decoded])
+            extraction_time = (time.perf_counter() - extraction_start) / len(batch)
+
+            scoring_start = time.perf_counter()
+            with PROFILER.stage(u'classify/score'):
+                distances = self.__model.distances(features)
+                labels = np.argmin(distances, axis=1)
+            scoring_time = (time.perf_counter() - scoring_start) / len(batch)
+
+            for image, label, distance, feature in zip(batch, labels, distances, features):
+                yield ClassificationResult(image if isinstance(image, str) else None, int(label), distance,
+                                           extraction_time, scoring_time, feature)
+
+    @staticmethod
+    def decode(image) -> np.ndarray:
+        if not isinstance(image, str):
+            return image
+
+        with PROFILER.stage(u'classify/decode'):
+            pixels = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+        if pixels is None:
+            raise IOError(f'Could not decode {image}')
+        return pixels
+
+    def mahalanobis(self, features: np.ndarray) -> np.ndarray:
+        return self.__model.distances(features)
+
+    def save_model(self, filename: str) -> None:
+        arrays: dict = {
+            'mean': self.__model.get_means(),
+            'covariance': self.__model.get_covariances(),
+            'inverse_covariance': self.__model.get_inverses(),
+            'confusion_matrix': np.array(self.__confusionMatrix, dtype=np.int64)
+        }
+        if self.__model.get_choleskys() is not None:
+            arrays['cholesky'] = self.__model.get_choleskys()
+        if self.__accumulators is not None:
+            arrays['counts'] = np.array([accumulator.get_count() for accumulator in self.__accumulators])
+            # The saved model is regularized, updates need the raw statistics it came from
+            states: list = [accumulator.get_state() for accumulator in self.__accumulators]
+            for name in set.intersection(*(set(state) for state in states)):
+                arrays[f'accumulator_{name}'] = np.array([state[name] for state in states])
+
+        ModelFile.save(filename, arrays, {
+            'features': self.__textureFeatures.get_parameters(),
+            'covariance_solver': self.__covarianceSolver.get_parameters(),
+            'accuracy': self.__accuracy
+        })
+
+    def set_features(self, parameters: dict) -> None:
+        # Everything that depends on the feature layout follows the extractor: the workers, the cache file and
+        # the stores
+        self.__textureFeatures = create_extractor(parameters, self.__kernels)
+        parameters = self.__textureFeatures.get_parameters()
+
+        if self.__parallelExtractor is not None:
+            self.__parallelExtractor.set_parameters(parameters)
+
+        if self.__featureCache is not None:
+            self.__featureCache.save()
+            self.__featureCache = FeatureCache(self.__featureCache.get_directory(), parameters,
+                                               self.__featureCache.get_max_age())
+
+        self.__datasetFeatures = None
+        self.__trainFeatures = FeatureStore(self.__textureFeatures.size())
+        self.__testFeatures = FeatureStore(self.__textureFeatures.size())
+
+    def load_model(self, filename: str) -> None:
+        arrays, metadata = ModelFile.load(filename)
+
+        self.set_features(metadata['features'])
+        self.__model = MahalanobisModel(arrays['mean'], arrays['covariance'], arrays['inverse_covariance'],
+                                        arrays.get('cholesky'))
+        if 'covariance_solver' in metadata:
+            self.__covarianceSolver = CovarianceSolver(**metadata['covariance_solver'])
+        if 'accumulator_scatter' in arrays:
+            names: tuple = (u'mean', u'scatter', u'origin', u'cubic', u'quartic')
+            columns: list = [arrays.get(f'accumulator_{name}', [None] * len(arrays['counts'])) for name in names]
+            self.__accumulators = [ClassAccumulator.from_state(count, *state)
+                                   for count, *state in zip(arrays['counts'], *columns)]
+        elif 'counts' in arrays:
+            # Older files only kept the regularized covariances, updates start from those
+            self.__accumulators = [
+                ClassAccumulator.from_statistics(count, mean, covariance)
+                for count, mean, covariance in zip(arrays['counts'], arrays['mean'], arrays['covariance'])
+            ]
+        else:
+            self.__accumulators = None
+        self.__confusionMatrix = arrays['confusion_matrix'].tolist()
+        self.__accuracy = metadata['accuracy']
 
     def show_confusion_matrix(self) -> str:
         matrix: list[list] = self.__confusionMatrix.copy()
         return (
-            f"""| {matrix[0][0]:02} | {matrix[0][1]:02} | {matrix[0][2]:02} | {matrix[0][3]:02} |\n"""
-            f"""| {matrix[1][0]:02} | {matrix[1][1]:02} | {matrix[1][2]:02} | {matrix[1][3]:02} |\n"""
-            f"""| {matrix[2][0]:02} | {matrix[2][1]:02} | {matrix[2][2]:02} | {matrix[2][3]:02} |\n"""
-            f"""| {matrix[3][0]:02} | {matrix[3][1]:02} | {matrix[3][2]:02} | {matrix[3][3]:02} |\n"""
+            ''.join(f"""| {' | '.join(f'{value:02}' for value in row)} |\n""" for row in matrix) +
             f"""\nAcurácia: {self.__accuracy:.2f} %\n"""
-            f"""Especificidade: {((100 - self.__accuracy) / 300):.6f}"""
+            f"""Especificidade: {((100 - self.__accuracy) / (100 * (len(matrix) - 1))):.6f}"""
         )
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+from .PackedDataset import PackedDataset
+
+
+class ImageDataset:
+    EXTENSIONS: tuple = (u'.png', u'.tif')
+    MEMORY_BUDGET: int = 256 * 1024 * 1024
+
+    __paths: list
+    __memoryBudget: int
+    __memoryUsed: int
+    __decoded: OrderedDict
+    __directory: str = None
+    __packed: PackedDataset = None
+    __packedIndex: dict
+
+    def __init__(self, memory_budget: int = MEMORY_BUDGET):
+        self.__paths = []
+        self.__memoryBudget = memory_budget
+        self.__memoryUsed = 0
+        self.__decoded = OrderedDict()
+        self.__packedIndex = {}
+
+    def index(self, directory_path: str, packed: bool = True) -> None:
+        # A packed copy of the dataset is preferred, it is mapped instead of decoding every file
+        packed_filename = PackedDataset.find(directory_path) if packed else None
+        if packed_filename is not None:
+            self.open_packed(packed_filename)
+            return
+
+        # Only the paths are kept, pixels are decoded when someone asks for them
+        self.__directory = directory_path
+        self.__packed = None
+        self.__packedIndex = {}
+        # Classes are numbered by their folder, as many as the highest folder number found
+        self.__paths = []
+        for directory in sorted(os.listdir(directory_path)):
+
+            image_files: str = os.path.join(directory_path, directory)
+            if os.path.isfile(image_files) is False:
+
+                for img in sorted(os.listdir(image_files)):
+
+                    if img.endswith(self.EXTENSIONS):
+                        image_full_path: str = str(image_files + '/' + img).replace('\\', '/')
+                        self.__paths.extend([] for _ in range(int(directory) - len(self.__paths)))
+                        self.__paths[int(directory) - 1].append(image_full_path)
+
+    def open_packed(self, filename: str) -> None:
+        # Paths are rebuilt as the files were laid out when packed, they only identify the images
+        self.__packed = PackedDataset(filename)
+        self.__directory = os.path.dirname(filename)
+        self.__paths = [[] for _ in range(self.__packed.get_classes())]
+        self.__packedIndex = {}
+
+        for position, (relative, label) in enumerate(zip(self.__packed.get_paths(), self.__packed.get_labels())):
+            path: str = str(self.__directory + '/' + relative).replace('\\', '/')
+            self.__paths[label].append(path)
+            self.__packedIndex[path] = position
+
+    def pack(self, filename: str = None) -> str:
+        filename = filename if filename is not None else os.path.join(self.__directory, PackedDataset.FILENAME)
+        return PackedDataset.pack(self.__paths, filename, self.__directory)
+
+    def get_packed(self) -> PackedDataset:
+        return self.__packed
+
+    def locate(self, path: str):
+        # Position of the image inside the pack, or its path when it is read from its own file
+        return self.__packedIndex.get(path, path)
+
+    def get_key(self, path: str):
+        position = self.__packedIndex.get(path)
+        return self.__packed.get_key(position) if position is not None else None
+
+    def get_classes(self) -> int:
+        return len(self.__paths)
+
+    def get_paths(self, label: int = None) -> list:
+        if label is None:
+            return [path for paths in self.__paths for path in paths]
+        return self.__paths[label]
+
+    def get_memory_used(self) -> int:
+        return self.__memoryUsed
+
+    def __len__(self) -> int:
+        return sum(len(paths) for paths in self.__paths)
+
+    def read(self, path: str) -> np.ndarray:
+        position = self.__packedIndex.get(path)
+        if position is not None:
+            PROFILER.count(u'dataset/packed')
+            return self.__packed.image(position)
+
+        image = self.__decoded.get(path)
+        if image is not None:
+            self.__decoded.move_to_end(path)
+            return image
+
+        with PROFILER.stage(u'dataset/decode'):
+            image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        PROFILER.count(u'dataset/decoded')
+        if image is None:
+            raise IOError(f'Could not decode image {path}')
+
+        # Least recently used images are dropped to stay within the memory budget
+        if image.nbytes <= self.__memoryBudget:
+            while self.__memoryUsed + image.nbytes > self.__memoryBudget:
+                _, dropped = self.__decoded.popitem(last=False)
+                self.__memoryUsed -= dropped.nbytes
+            self.__decoded[path] = image
+            self.__memoryUsed += image.nbytes
+
+        return image
+
+    def stream(self, paths: list):
+        for path in paths:
+            yield path, self.read(path)
+
+    def release(self) -> None:
+        self.__decoded.clear()
+        self.__memoryUsed = 0
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+from .CovarianceSolver import CovarianceSolver
+
+
+class MahalanobisModel:
+    __means: np.ndarray
+    __covariances: np.ndarray
+    __inverses: np.ndarray
+    __choleskys: np.ndarray = None
+
+    def __init__(self, means: np.ndarray, covariances: np.ndarray, inverses: np.ndarray = None,
+                 choleskys: np.ndarray = None):
+        self.__means = np.asarray(means, dtype=np.float64)
+        self.__covariances = np.asarray(covariances, dtype=np.float64)
+        self.__choleskys = np.asarray(choleskys, dtype=np.float64) if choleskys is not None else None
+
+        if inverses is not None:
+            self.__inverses = np.asarray(inverses, dtype=np.float64)
+        elif self.__choleskys is not None:
+            self.__inverses = np.array([CovarianceSolver.inverse(cholesky) for cholesky in self.__choleskys])
+        else:
+            self.__inverses = np.linalg.inv(self.__covariances)
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: np.ndarray, classes: int, solver: CovarianceSolver = None):
+        cls.check_counts(np.bincount(labels, minlength=classes)[:classes])
+        with PROFILER.stage(u'model/covariance'):
+            grouped: list = [features[labels == label] for label in range(classes)]
+            means = np.array([group.mean(axis=0) for group in grouped])
+            covariances = np.array([np.cov(group.T) for group in grouped])
+
+        with PROFILER.stage(u'model/inversion'):
+            if solver is None:
+                return cls(means, covariances)
+
+            covariances = np.array([solver.regularize(covariance, group)
+                                    for covariance, group in zip(covariances, grouped)])
+            return cls(means, covariances,
+                       choleskys=np.array([solver.factorize(covariance) for covariance in covariances]))
+
+    @classmethod
+    def from_accumulators(cls, accumulators: list, solver: CovarianceSolver = None):
+        # Same regularization and factorization as fit, the accumulators stand in for the samples
+        cls.check_counts([accumulator.get_count() for accumulator in accumulators])
+        means = np.array([accumulator.get_mean() for accumulator in accumulators])
+        covariances = np.array([accumulator.get_covariance() for accumulator in accumulators])
+        if solver is None:
+            return cls(means, covariances)
+
+        with PROFILER.stage(u'model/inversion'):
+            covariances = np.array([
+                solver.regularize(covariance, statistics=(accumulator.get_count(), accumulator.get_scatter(),
+                                                          accumulator.get_fourth_moments()))
+                for covariance, accumulator in zip(covariances, accumulators)
+            ])
+            return cls(means, covariances,
+                       choleskys=np.array([solver.factorize(covariance) for covariance in covariances]))
+
+    @staticmethod
+    def check_counts(counts) -> None:
+        # A class needs two samples for a covariance, with fewer its mean and covariance would be NaN
+        for label, count in enumerate(counts):
+            if count < 2:
+                raise ValueError(f'Class {label + 1} has {count} samples, at least 2 are needed')
+
+    def get_means(self) -> np.ndarray:
+        return self.__means
+
+    def get_covariances(self) -> np.ndarray:
+        return self.__covariances
+
+    def get_inverses(self) -> np.ndarray:
+        return self.__inverses
+
+    def get_choleskys(self) -> np.ndarray:
+        return self.__choleskys
+
+    def get_classes(self) -> int:
+        return self.__means.shape[0]
+
+    def distances(self, features: np.ndarray) -> np.ndarray:
+        if self.__choleskys is not None:
+            return CovarianceSolver.distances(features, self.__means, self.__choleskys)
+
+        # (N, features) against every class at once, gives the (N, classes) squared distances
+        difference = np.atleast_2d(features)[:, None, :] - self.__means[None, :, :]
+        return np.einsum('nkd,kde,nke->nk', difference, self.__inverses, difference, optimize=True)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return np.argmin(self.distances(features), axis=1)
+
+    def confusion_matrix(self, features: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        matrix = np.zeros((self.get_classes(), self.get_classes()), dtype=np.int64)
+        np.add.at(matrix, (labels, self.predict(features)), 1)
+        return matrix
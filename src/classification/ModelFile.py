@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+
+class ModelFile:
+    MAGIC: bytes = b'BIRADSMD'
+    VERSION: int = 1
+    ALIGNMENT: int = 64
+
+    # magic, format version, header length
+    __prefix: struct.Struct = struct.Struct('<8sII')
+
+    @classmethod
+    def save(cls, filename: str, arrays: dict, metadata: dict) -> None:
+        arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+        # Offsets depend on the header size and the header holds the offsets, repeat until the size settles
+        layout: dict = {}
+        header: bytes = b''
+        while True:
+            offset = cls.__align(cls.__prefix.size + len(header))
+            for name, array in arrays.items():
+                layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+                offset = cls.__align(offset + array.nbytes)
+
+            settled = json.dumps({'metadata': metadata, 'arrays': layout}).encode(u'utf-8')
+            settled += b' ' * (cls.__align(cls.__prefix.size + len(settled)) - cls.__prefix.size - len(settled))
+            previous, header = header, settled
+            if len(header) == len(previous):
+                break
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=u'.model')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(cls.__prefix.pack(cls.MAGIC, cls.VERSION, len(header)))
+                file.write(header)
+                for name, array in arrays.items():
+                    file.seek(layout[name]['offset'])
+                    array.tofile(file)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, filename)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    @classmethod
+    def load(cls, filename: str) -> tuple:
+        with open(filename, 'rb') as file:
+            magic, version, header_length = cls.__prefix.unpack(file.read(cls.__prefix.size))
+            if magic != cls.MAGIC:
+                raise ValueError(f'{filename} is not a classifier model file')
+            if version != cls.VERSION:
+                raise ValueError(f'Unsupported model file version {version}, expected {cls.VERSION}')
+            header: dict = json.loads(file.read(header_length).decode(u'utf-8'))
+
+        # Arrays are read only views over the mapped file, nothing is copied until used
+        buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+        arrays: dict = {}
+        for name, layout in header['arrays'].items():
+            dtype = np.dtype(layout['dtype'])
+            size = int(np.prod(layout['shape'], dtype=np.int64)) * dtype.itemsize
+            arrays[name] = buffer[layout['offset']:layout['offset'] + size].view(dtype).reshape(layout['shape'])
+
+        return arrays, header['metadata']
+
+    @classmethod
+    def __align(cls, offset: int) -> int:
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from .FeatureCache import FeatureCache
+from .ModelFile import ModelFile
+
+
+class PackedDataset:
+    FILENAME: str = u'dataset.pack'
+    FORMAT: str = u'packed-dataset'
+
+    __filename: str
+    __pixels: np.ndarray
+    __offsets: np.ndarray
+    __shapes: np.ndarray
+    __labels: np.ndarray
+    __keys: np.ndarray
+    __paths: list
+    __classes: int
+
+    def __init__(self, filename: str):
+        arrays, metadata = ModelFile.load(filename)
+        if metadata.get('format') != self.FORMAT:
+            raise ValueError(f'{filename} is not a packed dataset')
+
+        self.__filename = filename
+        self.__pixels = arrays['pixels']
+        self.__offsets = arrays['offsets']
+        self.__shapes = arrays['shapes']
+        self.__labels = arrays['labels']
+        self.__keys = arrays['keys']
+        self.__paths = metadata['paths']
+        self.__classes = metadata['classes']
+
+    @classmethod
+    def find(cls, path: str):
+        # A pack given directly, or the one inside a class folder dataset unless images were added, removed or
+        # rewritten after packing
+        if os.path.isfile(path):
+            return path
+
+        packed = os.path.join(path, cls.FILENAME)
+        if not os.path.isfile(packed):
+            return None
+
+        packed_time = os.path.getmtime(packed)
+        for entry in os.scandir(path):
+            if entry.is_dir() and entry.stat().st_mtime > packed_time:
+                return None
+        return packed if cls.unchanged(packed, path) else None
+
+    @staticmethod
+    def unchanged(filename: str, root: str) -> bool:
+        # Overwriting a file keeps its folder's time, so every packed file is checked against the size and
+        # modification time it had when packed. Packs without them are never trusted
+        try:
+            arrays, metadata = ModelFile.load(filename)
+        except (OSError, ValueError):
+            return False
+        if 'sizes' not in arrays or 'mtimes' not in arrays:
+            return False
+
+        for name, size, mtime in zip(metadata['paths'], arrays['sizes'], arrays['mtimes']):
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                return False
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                return False
+        return True
+
+    @classmethod
+    def pack(cls, paths: list, filename: str, root: str = None) -> str:
+        # paths holds one list of image files per class. Pixels are appended to a scratch file as they are decoded,
+        # so packing never holds more than one image in memory
+        offsets: list = []
+        shapes: list = []
+        labels: list = []
+        keys: list = []
+        names: list = []
+        sizes: list = []
+        mtimes: list = []
+        root = root if root is not None else os.path.dirname(os.path.abspath(filename))
+
+        descriptor, scratch = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix=u'.pixels')
+        try:
+            total: int = 0
+            with os.fdopen(descriptor, 'wb') as file:
+                for label, class_paths in enumerate(paths):
+                    for path in class_paths:
+                        stat = os.stat(path)
+                        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+                        if image is None:
+                            raise IOError(f'Could not decode image {path}')
+
+                        file.write(image.tobytes())
+                        offsets.append(total)
+                        shapes.append(image.shape)
+                        labels.append(label)
+                        keys.append(FeatureCache.key(path))
+                        names.append(os.path.relpath(path, root).replace('\\', '/'))
+                        sizes.append(stat.st_size)
+                        mtimes.append(stat.st_mtime_ns)
+                        total += image.size
+
+            pixels = np.memmap(scratch, dtype=np.uint8, mode='r', shape=(total,)) if total else np.empty(0, np.uint8)
+            ModelFile.save(filename, {
+                'pixels': pixels,
+                'offsets': np.array(offsets, dtype=np.int64),
+                'shapes': np.array(shapes, dtype=np.int64).reshape((-1, 2)),
+                'labels': np.array(labels, dtype=np.int64),
+                'keys': np.array(keys, dtype=f'S{FeatureCache.KEY_SIZE}'),
+                'sizes': np.array(sizes, dtype=np.int64),
+                'mtimes': np.array(mtimes, dtype=np.int64)
+            }, {'format': cls.FORMAT, 'classes': len(paths), 'paths': names})
+            del pixels
+        finally:
+            os.remove(scratch)
+
+        return filename
+
+    def get_filename(self) -> str:
+        return self.__filename
+
+    def get_classes(self) -> int:
+        return self.__classes
+
+    def get_labels(self) -> np.ndarray:
+        return self.__labels
+
+    def get_paths(self) -> list:
+        return self.__paths
+
+    def get_key(self, index: int) -> bytes:
+        return bytes(self.__keys[index])
+
+    def image(self, index: int) -> np.ndarray:
+        # A read only view over the mapped file, nothing is copied or decoded
+        rows, columns = self.__shapes[index]
+        start = self.__offsets[index]
+        return self.__pixels[start:start + rows * columns].reshape((rows, columns))
+
+    def __len__(self) -> int:
+        return len(self.__labels)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union
+
+import cv2
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+from .FeaturePyramid import FeaturePyramid, create_extractor
+from .PackedDataset import PackedDataset
+from .TextureFeatures import TextureFeatures
+
+# Extractor owned by each worker process, built once by the pool initializer
+_workerFeatures: Union[TextureFeatures, FeaturePyramid] = None
+
+
+# Packed dataset mapped by each worker, images are then sent as their position in it
+_workerPacked: PackedDataset = None
+
+
+def _initialize_worker(parameters: dict, packed_filename: str = None, kernels: str = u'numpy') -> None:
+    global _workerFeatures, _workerPacked
+    _workerFeatures = create_extractor(parameters, kernels)
+    _workerPacked = PackedDataset(packed_filename) if packed_filename is not None else None
+
+
+def _extract_chunk(paths: list) -> np.ndarray:
+    # Workers decode the files themselves, only paths and feature vectors cross the process boundary
+    return np.array([
+        _workerFeatures.extract(
+            _workerPacked.image(path) if isinstance(path, int) else cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+        for path in paths
+    ])
+
+
+class ParallelFeatureExtractor:
+    __workers: int
+    __chunkSize: int
+    __parameters: dict
+    __packedFilename: str = None
+    __kernels: str
+    __executor: ProcessPoolExecutor = None
+
+    def __init__(self, workers: int = None, chunk_size: int = 16, parameters: dict = None, kernels: str = u'numpy'):
+        self.__workers = workers if workers else os.cpu_count() or 1
+        self.__chunkSize = max(1, chunk_size)
+        self.__parameters = parameters if parameters is not None else TextureFeatures().get_parameters()
+        self.__kernels = kernels
+
+    def get_workers(self) -> int:
+        return self.__workers
+
+    def get_parameters(self) -> dict:
+        return self.__parameters
+
+    def set_parameters(self, parameters: dict) -> None:
+        # Workers build their extractor when they start, other parameters need new workers
+        if parameters != self.__parameters:
+            self.close()
+            self.__parameters = parameters
+
+    def set_packed(self, filename: str = None) -> None:
+        # Workers map the pack when they start, a different pack needs new workers
+        if filename != self.__packedFilename:
+            self.close()
+            self.__packedFilename = filename
+
+    def extract(self, paths: list) -> np.ndarray:
+        if len(paths) == 0:
+            return np.empty((0, create_extractor(self.__parameters).size()))
+
+        chunks: list = [paths[i:i + self.__chunkSize] for i in range(0, len(paths), self.__chunkSize)]
+
+        if self.__workers == 1 or len(chunks) == 1:
+            _initialize_worker(self.__parameters, self.__packedFilename, self.__kernels)
+            return np.concatenate([_extract_chunk(chunk) for chunk in chunks])
+
+        if self.__executor is None:
+            # Spawned workers avoid forking a process that may own Qt threads
+            self.__executor = ProcessPoolExecutor(max_workers=self.__workers,
+                                                  mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=_initialize_worker,
+                                                  initargs=(self.__parameters, self.__packedFilename, self.__kernels))
+
+        # map keeps the submission order, so rows line up with the given paths. Stages inside the workers are
+        # not profiled, only the whole round trip is
+        with PROFILER.stage(u'features/parallel'):
+            return np.concatenate(list(self.__executor.map(_extract_chunk, chunks)))
+
+    def close(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from ..profiling.Profiler import PROFILER
+
+
+class TextureFeatures:
+    DISTANCES: tuple = (1, 2, 4, 8, 16)
+    ANGLES: tuple = (0, np.pi / 4, np.pi / 2, 3 * np.pi / 4)
+    LEVELS: int = 32
+
+    __distances: tuple
+    __angles: tuple
+    __levels: int
+    __divisor: int
+    __offsets: list
+    __contrastWeights: np.ndarray
+    __homogeneityWeights: np.ndarray
+    __pairPlan: dict
+
+    def __init__(self, distances: tuple = DISTANCES, angles: tuple = ANGLES, levels: int = LEVELS):
+        self.__distances = tuple(distances)
+        self.__angles = tuple(angles)
+        self.__levels = levels
+        self.__divisor = 256 // levels
+
+        # Same offset convention as skimage greycomatrix: (row, column) displacement per distance/angle
+        self.__offsets = [
+            (int(round(np.sin(angle) * distance)), int(round(np.cos(angle) * distance)))
+            for distance in self.__distances
+            for angle in self.__angles
+        ]
+
+        i, j = np.ogrid[0:levels, 0:levels]
+        self.__contrastWeights = ((i - j) ** 2).reshape((levels, levels, 1, 1))
+        self.__homogeneityWeights = (1. / (1. + (i - j) ** 2)).reshape((levels, levels, 1, 1))
+
+        self.__pairPlan = {}
+
+    def get_parameters(self) -> dict:
+        return {
+            'distances': self.__distances,
+            'angles': self.__angles,
+            'levels': self.__levels
+        }
+
+    def get_offsets(self) -> list:
+        return self.__offsets
+
+    def size(self) -> int:
+        return 2 * len(self.__distances) + 1
+
+    def names(self) -> list:
+        # One per value of extract, in the same order
+        return [f'contrast d{distance}' for distance in self.__distances] + \
+            [f'homogeneity d{distance}' for distance in self.__distances] + [u'entropy']
+
+    def quantize(self, image: np.ndarray) -> np.ndarray:
+        if image.dtype == np.uint8 and self.__divisor == 8:
+            return np.right_shift(image, 3).astype(np.intp)
+        return np.array(image / self.__divisor, 'int')
+
+    def pair_plan(self, shape: tuple) -> tuple:
+        # Overlapping (first, second) pixel slices for every offset and where each one lands in the
+        # encoded pair buffer, so a single bincount yields all co-occurrence matrices at once
+        if shape not in self.__pairPlan:
+            rows, columns = shape
+            plan: list = []
+            total: int = 0
+
+            for index, (d_row, d_column) in enumerate(self.__offsets):
+                row_start, row_end = max(0, -d_row), min(rows, rows - d_row)
+                column_start, column_end = max(0, -d_column), min(columns, columns - d_column)
+                if row_start >= row_end or column_start >= column_end:
+                    continue
+
+                size = (row_end - row_start) * (column_end - column_start)
+                plan.append((
+                    (slice(row_start, row_end), slice(column_start, column_end)),
+                    (slice(row_start + d_row, row_end + d_row), slice(column_start + d_column, column_end + d_column)),
+                    slice(total, total + size),
+                    (row_end - row_start, column_end - column_start),
+                    index * self.__levels * self.__levels
+                ))
+                total += size
+
+            self.__pairPlan[shape] = (plan, total)
+
+        return self.__pairPlan[shape]
+
+    def counts(self, data: np.ndarray) -> np.ndarray:
+        # Raw (levels, levels, distances, angles) pair counts, before symmetrization and normalization
+        levels = self.__levels
+        plan, total = self.pair_plan(data.shape)
+
+        data = data.astype(np.intp, copy=False)
+        scaled = data * levels
+        pairs = np.empty(total, dtype=np.intp)
+        for first, second, target, shape, block in plan:
+            encoded = pairs[target].reshape(shape)
+            np.add(scaled[first], data[second], out=encoded)
+            if block:
+                encoded += block
+
+        counts = np.bincount(pairs, minlength=len(self.__offsets) * levels * levels)
+        return np.ascontiguousarray(
+            counts.reshape((len(self.__distances), len(self.__angles), levels, levels)).transpose((2, 3, 0, 1)))
+
+    def co_occurrence(self, data: np.ndarray) -> np.ndarray:
+        return self.symmetric(self.counts(data))
+
+    def symmetric(self, counts: np.ndarray) -> np.ndarray:
+        counts = counts + np.transpose(counts, (1, 0, 2, 3))
+        return self.normalize(counts)
+
+    def histogram(self, data: np.ndarray) -> np.ndarray:
+        return np.bincount(data.ravel(), minlength=self.__levels)
+
+    @staticmethod
+    def normalize(glcm: np.ndarray) -> np.ndarray:
+        glcm = glcm.astype(np.float64)
+        glcm_sums = np.sum(glcm, axis=(0, 1), keepdims=True)
+        glcm_sums[glcm_sums == 0] = 1
+        glcm /= glcm_sums
+        return glcm
+
+    @staticmethod
+    def entropy(histogram: np.ndarray) -> float:
+        # Same reduction as skimage shannon_entropy (scipy.stats.entropy) over the non empty bins of the histogram,
+        # scipy.special is imported on first use, scipy.stats alone takes longer to import than a whole training
+        from scipy.special import entr
+
+        probabilities = 1.0 * histogram[histogram > 0] / np.sum(histogram[histogram > 0], keepdims=True)
+        return np.sum(entr(probabilities)) / np.log(2)
+
+    def contrast(self, glcm: np.ndarray) -> list:
+        return [sum(i) for i in np.sum(glcm * self.__contrastWeights, axis=(0, 1))]
+
+    def homogeneity(self, glcm: np.ndarray) -> list:
+        return [sum(i) for i in np.sum(glcm * self.__homogeneityWeights, axis=(0, 1))]
+
+    def attributes(self, image: np.ndarray) -> list:
+        with PROFILER.stage(u'features/quantize'):
+            data = self.quantize(image)
+        with PROFILER.stage(u'features/co_occurrence'):
+            counts = self.counts(data)
+        return self.properties(counts, self.histogram(data))
+
+    def properties(self, counts: np.ndarray, histogram: np.ndarray) -> list:
+        # greycoprops renormalizes the already normed matrix, keep that step for identical results
+        with PROFILER.stage(u'features/properties'):
+            glcm = self.normalize(self.symmetric(counts))
+            contrast, homogeneity = self.contrast(glcm), self.homogeneity(glcm)
+
+        with PROFILER.stage(u'features/entropy'):
+            entropy = self.entropy(histogram)
+
+        return [contrast, homogeneity, entropy]
+
+    def extract(self, image: np.ndarray) -> np.ndarray:
+        return np.concatenate(self.attributes(image), axis=None)
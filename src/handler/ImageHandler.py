@@ -1,31 +1,56 @@
 # -*- coding: utf-8 -*-
 
-from PIL import Image, ImageQt, ImageOps
+import numpy as np
+from PIL import Image
+
+from .ImagePipeline import ImagePipeline, Operation
+from .TiledImage import TiledImage
 
 
 class ImageHandler:
     ZOOM_RATIO: tuple = (0, 0, 128, 128)
+    ZOOM_SIZE: tuple = (128 * 5, 128 * 5)
+    ROI_SIZE: tuple = (128, 128)
+    DENSITY_COLORS: tuple = ((46, 204, 113), (241, 196, 15), (230, 126, 34), (231, 76, 60))
 
     __ratioOriginalToInterface: tuple
-    __tempImage: Image = None
-    __in_zoom: bool = False
     __interfaceImage: Image
-    __originalImage: Image
+    __source: TiledImage
+    __pipeline: ImagePipeline
     __filename: str
     __imageSize: tuple = (1280, 720)
 
     def __init__(self, filename: str):
+        # The source is decoded tile by tile into a pyramid once, every view is rendered from it by the pipeline
         self.__filename = filename
-        with Image.open(filename) as image:
-            self.__originalImage = image.copy()
-            self.normalize(image)
+        self.__source = TiledImage(filename)
+        self.__pipeline = ImagePipeline(self.__source, self.__imageSize)
+        self.normalize()
 
     def get_image(self, original: bool = False) -> Image:
-        return self.__originalImage if original else self.__interfaceImage
+        return Image.fromarray(self.__source.read()) if original else self.__interfaceImage
+
+    def get_array(self, original: bool = False) -> np.ndarray:
+        return self.__source.read() if original else self.to_array(self.__interfaceImage)
+
+    def get_source(self) -> TiledImage:
+        return self.__source
 
-    def get_qt_image(self, original: bool = False) -> ImageQt:
-        return ImageQt.toqimage(self.normalize(self.__originalImage)) \
-            if original else ImageQt.toqimage(self.__interfaceImage)
+    def get_pipeline(self) -> ImagePipeline:
+        return self.__pipeline
+
+    def get_view_key(self) -> tuple:
+        # Identifies what get_image shows: the file, the size it is fitted to and the operations applied
+        return self.__filename, self.__pipeline.get_display_size(), self.__pipeline.get_operations()
+
+    @staticmethod
+    def to_array(image: Image) -> np.ndarray:
+        # 8 bit grey levels as cv2.IMREAD_GRAYSCALE would decode them, without going through a file
+        if image.mode == 'L':
+            return np.asarray(image)
+        if image.mode.startswith('I'):
+            return (np.asarray(image).astype(np.uint32) >> 8).astype(np.uint8)
+        return np.asarray(image.convert('L'))
 
     def get_file_path(self) -> str:
         return self.__filename
@@ -36,62 +61,102 @@ class ImageHandler:
     def get_image_size(self) -> tuple:
         return self.__interfaceImage.size
 
-    def normalize(self, image: Image) -> Image:
+    def normalize(self, image: Image = None) -> Image:
+        # Without an image the current operations are shown over the whole source at the interface size
+        width, height = image.size if image is not None else self.__source.get_size()
         ratio = (
-            image.width // self.__imageSize[0],
-            image.height // self.__imageSize[1]
+            width // self.__imageSize[0],
+            height // self.__imageSize[1]
         )
         self.__ratioOriginalToInterface = (
             1 if ratio[0] < 1 else ratio[0],
             1 if ratio[1] < 1 else ratio[1]
         )
+        size: tuple = self.__imageSize if ratio[0] > 1 and ratio[1] > 1 else (width, height)
 
-        self.__interfaceImage = image.resize(
-            self.__imageSize if ratio[0] > 1 and ratio[1] > 1 else image.size
-        )
+        if image is not None:
+            self.__interfaceImage = image.resize(size)
+            return self.__interfaceImage
+
+        self.__pipeline.set_display_size(size)
+        self.__interfaceImage = self.__pipeline.render()
 
         return self.__interfaceImage
 
-    def zoom_in(self, region: tuple = (0, 0)) -> Image:
-        self.temporary_image(True)
-        zoom_region = (
+    def apply(self, operation: Operation) -> Image:
+        self.__interfaceImage = self.__pipeline.apply(operation)
+        return self.__interfaceImage
+
+    def replace(self, operation: Operation) -> Image:
+        # Quantizing, resizing or equalizing again starts over from the view before the previous one, as when
+        # the original image was restored for every step
+        operations: tuple = self.__pipeline.get_operations()
+        if operations and operations[-1].name == operation.name:
+            operations = operations[:-1]
+        self.__interfaceImage = self.__pipeline.change(operations + (operation,))
+        return self.__interfaceImage
+
+    def zoom_region(self, region: tuple = (0, 0)) -> Operation:
+        return Operation(u'crop', ((
             self.ZOOM_RATIO[0] + region[0], self.ZOOM_RATIO[1] + region[1],
             self.ZOOM_RATIO[2] + region[0], self.ZOOM_RATIO[3] + region[1]
-        )
-        self.__interfaceImage = self.__interfaceImage.crop(zoom_region).resize((128*5, 128*5))
+        ), self.ZOOM_SIZE))
 
-        return self.__interfaceImage
+    def zoom_in(self, region: tuple = (0, 0)) -> Image:
+        return self.apply(self.zoom_region(region))
+
+    def roi(self, region: tuple = (0, 0)) -> np.ndarray:
+        # The selection box through the current operations at the size of the model's ROIs, read from the source
+        # when only geometric ones apply. Neither recorded nor memoized, so it can follow the mouse
+        box, _ = self.zoom_region(region).arguments
+        operations: tuple = self.__pipeline.get_operations() + (Operation(u'crop', (box, self.ROI_SIZE)),)
+        return self.to_array(self.__pipeline.render(operations, keep=False))
 
     def zoom_out(self) -> Image:
-        self.temporary_image(False)
+        # Back to before the last zoom, or to the original view when there is none
+        operations: tuple = self.__pipeline.get_operations()
+        crops: list = [index for index, operation in enumerate(operations) if operation.name == u'crop']
+        self.__interfaceImage = self.__pipeline.change(operations[:crops[-1]] if crops else ())
         return self.__interfaceImage
 
+    def reset(self) -> Image:
+        if self.__pipeline.get_operations():
+            self.__pipeline.change(())
+        return self.normalize()
+
     def gray_scale(self, scale: int) -> Image:
-        self.temporary_image(True)
-        self.__interfaceImage = self.__interfaceImage.quantize(scale)
-        return self.__interfaceImage
+        return self.replace(Operation(u'quantize', (scale,)))
 
     def new_resolution(self, new_size: int) -> Image:
         if new_size == 32 or new_size == 64:
-            self.temporary_image(True)
-            self.__interfaceImage = self.__interfaceImage.resize((new_size, new_size))
+            self.replace(Operation(u'resize', ((new_size, new_size),)))
         return self.__interfaceImage
 
     def equalize(self) -> Image:
-        self.__interfaceImage = ImageOps.equalize(self.__interfaceImage)
+        return self.replace(Operation(u'equalize'))
+
+    def undo(self) -> Image:
+        self.__interfaceImage = self.__pipeline.undo()
+        return self.__interfaceImage
+
+    def redo(self) -> Image:
+        self.__interfaceImage = self.__pipeline.redo()
         return self.__interfaceImage
 
-    def temporary_image(self, is_zoom: bool) -> None:
-        if self.__tempImage is None and is_zoom:
-            self.__tempImage = self.__interfaceImage.copy()
-            self.__in_zoom = True
-        else:
-            if self.__tempImage is not None and is_zoom:
-                self.__interfaceImage = self.__tempImage.copy()
-            else:
-                self.normalize(self.__originalImage)
-            self.__tempImage = None
-            self.__in_zoom = False
+    def density_overlay(self, labels: np.ndarray, window: int, stride: int, alpha: float = 0.4) -> Image:
+        # Each display pixel takes the class of the window centred closest to it in the original image
+        display: Image = self.__pipeline.render(())
+        height, width = display.height, display.width
+        original_width, original_height = self.__source.get_size()
+        rows = (np.arange(height) * original_height / height - window // 2) // stride
+        columns = (np.arange(width) * original_width / width - window // 2) // stride
+        rows = np.clip(rows, 0, labels.shape[0] - 1).astype(int)
+        columns = np.clip(columns, 0, labels.shape[1] - 1).astype(int)
+
+        palette = np.array(self.DENSITY_COLORS, dtype=np.uint8)
+        colors = palette[np.clip(labels, 0, len(palette) - 1)][rows[:, None], columns[None, :]]
+
+        return Image.blend(display.convert('RGB'), Image.fromarray(colors, 'RGB'), alpha)
 
     def get_info(self) -> None:
         print('\nAttributes viewed image\n'
@@ -102,11 +167,12 @@ class ImageHandler:
               f'Image type:           {self.__interfaceImage.mode}'
               )
         print('\nAttributes original image\n'
-              f'Image resolution:     {self.__originalImage.size}\n'
-              f'Columns:              {self.__originalImage.width}\n'
-              f'Rows:                 {self.__originalImage.height}\n'
-              f'File type:            {self.__originalImage.format}\n'
-              f'Image type:           {self.__originalImage.mode}'
+              f'Image resolution:     {self.__source.get_size()}\n'
+              f'Columns:              {self.__source.get_size()[0]}\n'
+              f'Rows:                 {self.__source.get_size()[1]}\n'
+              f'File type:            {self.__source.get_format()}\n'
+              f'Image type:           {self.__source.get_dtype()}\n'
+              f'Pyramid levels:       {self.__source.get_levels()}'
               )
         print('\nRatio among original image and interface image\n'
               f'Width ratio:  {self.__ratioOriginalToInterface[0]}\n'
@@ -114,7 +180,6 @@ class ImageHandler:
               )
 
     def close(self) -> None:
+        self.__pipeline.clear()
         self.__interfaceImage.close()
-        self.__originalImage.close()
-        if self.__tempImage is not None:
-            self.__tempImage.close()
+        self.__source.close()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from typing import NamedTuple
+
+from PIL import Image, ImageOps
+
+from .TiledImage import TiledImage
+
+
+class Operation(NamedTuple):
+    name: str
+    arguments: tuple = ()
+
+
+class ImagePipeline:
+    # crop takes (box in view pixels, output size), resize an output size. Both only change which part of the
+    # source is seen and at what size, so a leading run of them is one read from the tiles or the pyramid
+    GEOMETRIC: tuple = (u'crop', u'resize')
+    CACHE_SIZE: int = 8
+    HISTORY_SIZE: int = 100
+
+    __source: TiledImage
+    __displaySize: tuple
+    __history: list
+    __position: int
+    __results: OrderedDict
+
+    def __init__(self, source: TiledImage, display_size: tuple):
+        self.__source = source
+        self.__displaySize = tuple(display_size)
+        self.__history = [()]
+        self.__position = 0
+        self.__results = OrderedDict()
+
+    def get_display_size(self) -> tuple:
+        return self.__displaySize
+
+    def set_display_size(self, size: tuple) -> None:
+        self.__displaySize = tuple(size)
+
+    def get_operations(self) -> tuple:
+        return self.__history[self.__position]
+
+    def apply(self, operation: Operation) -> Image:
+        return self.change(self.get_operations() + (operation,))
+
+    def change(self, operations: tuple) -> Image:
+        # Every change is a new entry in the history, whatever could be redone is dropped
+        del self.__history[self.__position + 1:]
+        self.__history.append(tuple(operations))
+        del self.__history[:-self.HISTORY_SIZE]
+        self.__position = len(self.__history) - 1
+        return self.render()
+
+    def can_undo(self) -> bool:
+        return self.__position > 0
+
+    def can_redo(self) -> bool:
+        return self.__position < len(self.__history) - 1
+
+    def undo(self) -> Image:
+        self.__position = max(0, self.__position - 1)
+        return self.render()
+
+    def redo(self) -> Image:
+        self.__position = min(len(self.__history) - 1, self.__position + 1)
+        return self.render()
+
+    def view(self, operations: tuple) -> tuple:
+        # Source box and output size seen through the geometric operations, the others are ignored
+        width, height = self.__source.get_size()
+        box, size = (0., 0., float(width), float(height)), self.__displaySize
+        for operation in operations:
+            if operation.name == u'crop':
+                (left, top, right, bottom), output = operation.arguments
+                scale = ((box[2] - box[0]) / size[0], (box[3] - box[1]) / size[1])
+                box = (box[0] + left * scale[0], box[1] + top * scale[1],
+                       box[0] + right * scale[0], box[1] + bottom * scale[1])
+                size = tuple(output)
+            elif operation.name == u'resize':
+                size = tuple(operation.arguments[0])
+        return box, size
+
+    def render(self, operations: tuple = None, keep: bool = True) -> Image:
+        # Starts from the longest memoized prefix, the leading geometric run is read from the source at the
+        # visible region only and every other operation works on that. Without keep nothing new is memoized
+        store = self.store if keep else lambda _, result: result
+        operations = self.get_operations() if operations is None else tuple(operations)
+        leading = 0
+        while leading < len(operations) and operations[leading].name in self.GEOMETRIC:
+            leading += 1
+
+        image, start = None, leading
+        for end in range(len(operations), leading - 1, -1):
+            image = self.cached(operations[:end])
+            if image is not None:
+                start = end
+                break
+
+        if image is None:
+            box, size = self.view(operations[:leading])
+            image = store(operations[:leading], Image.fromarray(self.__source.region(box, size)))
+
+        for end in range(start, len(operations)):
+            image = store(operations[:end + 1], self.evaluate(image, operations[end]))
+
+        return image
+
+    @staticmethod
+    def evaluate(image: Image, operation: Operation) -> Image:
+        if operation.name == u'crop':
+            box, size = operation.arguments
+            return image.crop(tuple(box)).resize(tuple(size))
+        if operation.name == u'resize':
+            return image.resize(tuple(operation.arguments[0]))
+        if operation.name == u'quantize':
+            return image.quantize(*operation.arguments)
+        if operation.name == u'equalize':
+            return ImageOps.equalize(image)
+        raise ValueError(f'Unknown operation {operation.name}')
+
+    def cached(self, operations: tuple):
+        key = (self.__displaySize, operations)
+        image = self.__results.get(key)
+        if image is not None:
+            self.__results.move_to_end(key)
+        return image
+
+    def store(self, operations: tuple, image: Image) -> Image:
+        # Results are never modified in place, so the same image can be handed out and kept
+        self.__results[(self.__displaySize, operations)] = image
+        while len(self.__results) > self.CACHE_SIZE:
+            self.__results.popitem(last=False)
+        return image
+
+    def clear(self) -> None:
+        self.__results.clear()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+class TiledImage:
+    TILE_SIZE: int = 512
+    MIN_LEVEL_SIZE: int = 256
+    CACHE_BUDGET: int = 64 * 2 ** 20
+    TIFF_EXTENSIONS: tuple = (u'.tif', u'.tiff')
+
+    __filename: str
+    __size: tuple
+    __dtype: np.dtype
+    __format: str
+    __tiff = None
+    __page = None
+    __array: np.ndarray = None
+    __tileShape: tuple
+    __grid: tuple
+    __levels: list
+    __tiles: OrderedDict
+    __cacheUsed: int
+    __lock: threading.Lock
+
+    def __init__(self, filename: str):
+        self.__filename = filename
+        self.__tiles = OrderedDict()
+        self.__cacheUsed = 0
+        self.__lock = threading.Lock()
+
+        if not (filename.lower().endswith(self.TIFF_EXTENSIONS) and self.open_tiff(filename)):
+            self.open_decoded(filename)
+
+        self.__levels = [None]
+        self.build_pyramid()
+
+    def open_tiff(self, filename: str) -> bool:
+        # Tiles or strips of the first page are decoded one at a time. Layouts tifffile cannot hand out segment by
+        # segment (planar samples, missing codecs) fall back to a full decode
+        import tifffile
+
+        tiff = tifffile.TiffFile(filename)
+        page = tiff.pages[0]
+        try:
+            if page.planarconfig != 1 or len(page.chunks) != 2 or page.samplesperpixel not in (1, 3, 4):
+                raise ValueError(u'Unsupported layout')
+            self.__tiff, self.__page = tiff, page
+            self.__size = (page.imagewidth, page.imagelength)
+            self.__dtype = page.dtype
+            self.__format = u'TIFF'
+            self.__tileShape = tuple(page.chunks)
+            self.__grid = tuple(page.chunked[-2:])
+            self.decode_tile(0)
+        except Exception:
+            self.__tiff = self.__page = None
+            tiff.close()
+            return False
+
+        return True
+
+    def open_decoded(self, filename: str) -> None:
+        # Formats without tiles are decoded once, straight to 8 bit grey levels, tiles are then views over them.
+        # Only the header is read through PIL. OpenCV is imported here and below rather than with the module, the
+        # window imports this module at start up and should not wait for it
+        import cv2
+
+        from .ImageHandler import ImageHandler
+
+        with Image.open(filename) as image:
+            self.__size = image.size
+            self.__format = image.format
+            self.__dtype = np.dtype(np.uint16) if image.mode.startswith('I') else np.dtype(np.uint8)
+            self.__array = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+            if self.__array is None:
+                self.__array = ImageHandler.to_array(image)
+
+        self.__tileShape = (self.TILE_SIZE, self.TILE_SIZE)
+        self.__grid = (math.ceil(self.__size[1] / self.TILE_SIZE), math.ceil(self.__size[0] / self.TILE_SIZE))
+
+    def get_filename(self) -> str:
+        return self.__filename
+
+    def get_size(self) -> tuple:
+        return self.__size
+
+    def get_dtype(self) -> np.dtype:
+        return self.__dtype
+
+    def get_format(self) -> str:
+        return self.__format
+
+    def get_levels(self) -> int:
+        return len(self.__levels)
+
+    def get_cache_used(self) -> int:
+        return self.__cacheUsed
+
+    @staticmethod
+    def to_8bit(tile: np.ndarray) -> np.ndarray:
+        # Same grey levels as ImageHandler.to_array
+        import cv2
+
+        if tile.dtype != np.uint8:
+            tile = (tile.astype(np.uint32) >> 8).astype(np.uint8) if np.issubdtype(tile.dtype, np.integer) \
+                else np.clip(tile, 0, 255).astype(np.uint8)
+        if tile.ndim == 3:
+            tile = cv2.cvtColor(np.ascontiguousarray(tile), cv2.COLOR_RGB2GRAY)
+        return tile
+
+    def decode_tile(self, index: int) -> np.ndarray:
+        if self.__array is not None:
+            row, column = divmod(index, self.__grid[1])
+            rows, columns = self.__tileShape
+            return self.__array[row * rows:(row + 1) * rows, column * columns:(column + 1) * columns]
+
+        with self.__lock:
+            handle = self.__tiff.filehandle
+            handle.seek(self.__page.dataoffsets[index])
+            data = handle.read(self.__page.databytecounts[index])
+        segment, _, _ = self.__page.decode(data, index, jpegtables=self.__page.jpegtables)
+
+        # Segments come padded to the full tile size, edge tiles are cut back to the image
+        row, column = divmod(index, self.__grid[1])
+        rows, columns = self.__tileShape
+        segment = segment.reshape(segment.shape[-3:])
+        segment = segment[:min(rows, self.__size[1] - row * rows), :min(columns, self.__size[0] - column * columns)]
+        return self.to_8bit(segment[..., 0] if segment.shape[-1] == 1 else segment[..., :3])
+
+    def tile(self, index: int) -> np.ndarray:
+        # Decoded tiles are kept in a least recently used cache bounded by CACHE_BUDGET
+        with self.__lock:
+            tile = self.__tiles.get(index)
+            if tile is not None:
+                self.__tiles.move_to_end(index)
+                return tile
+
+        tile = self.decode_tile(index)
+        if self.__array is None:
+            with self.__lock:
+                if index not in self.__tiles:
+                    self.__tiles[index] = tile
+                    self.__cacheUsed += tile.nbytes
+                while self.__cacheUsed > self.CACHE_BUDGET and len(self.__tiles) > 1:
+                    _, released = self.__tiles.popitem(last=False)
+                    self.__cacheUsed -= released.nbytes
+        return tile
+
+    def build_pyramid(self) -> None:
+        # Every tile is decoded once and summed 2x2 into the first level, the source resolution is never held.
+        # Coarser levels halve the previous one until it fits MIN_LEVEL_SIZE
+        import cv2
+
+        width, height = self.__size
+        if max(width, height) <= self.MIN_LEVEL_SIZE:
+            return
+
+        level_height, level_width = (height + 1) // 2, (width + 1) // 2
+        sums = np.zeros((level_height, level_width), dtype=np.uint16)
+        rows, columns = self.__tileShape
+        for index in range(self.__grid[0] * self.__grid[1]):
+            row, column = divmod(index, self.__grid[1])
+            top, left = row * rows, column * columns
+            data = self.decode_tile(index)
+
+            # Tiles starting or ending on an odd pixel are padded with black to whole 2x2 blocks, the padding adds
+            # nothing to the sums
+            before = (top % 2, left % 2)
+            after = ((before[0] + data.shape[0]) % 2, (before[1] + data.shape[1]) % 2)
+            if any(before) or any(after):
+                data = np.pad(data, ((before[0], after[0]), (before[1], after[1])))
+                top, left = top - before[0], left - before[1]
+            target = sums[top // 2:top // 2 + data.shape[0] // 2, left // 2:left // 2 + data.shape[1] // 2]
+            target += data[0::2, 0::2]
+            target += data[1::2, 0::2]
+            target += data[0::2, 1::2]
+            target += data[1::2, 1::2]
+
+        # Pixels summed per level pixel, less than four on the last row and column of odd sizes. Rounded in bands
+        # so the temporaries stay small
+        row_counts = np.minimum(2, height - 2 * np.arange(level_height)).astype(np.uint16)
+        column_counts = np.minimum(2, width - 2 * np.arange(level_width)).astype(np.uint16)
+        level = np.empty((level_height, level_width), dtype=np.uint8)
+        for start in range(0, level_height, self.TILE_SIZE):
+            band = slice(start, start + self.TILE_SIZE)
+            counts = row_counts[band, None] * column_counts[None, :]
+            level[band] = (sums[band] + counts // 2) // counts
+        self.__levels.append(level)
+
+        while max(self.__levels[-1].shape) > self.MIN_LEVEL_SIZE:
+            previous = self.__levels[-1]
+            self.__levels.append(cv2.resize(previous, ((previous.shape[1] + 1) // 2, (previous.shape[0] + 1) // 2),
+                                            interpolation=cv2.INTER_AREA))
+
+    def read(self, box: tuple = None, level: int = 0) -> np.ndarray:
+        # box is (left, top, right, bottom) in source pixels, the result is at the level's scale and padded with
+        # black outside the image, as PIL crop does
+        box = box if box is not None else (0, 0) + self.__size
+        scale = 2 ** level
+        left, top = int(box[0]) // scale, int(box[1]) // scale
+        right, bottom = -(-int(box[2]) // scale), -(-int(box[3]) // scale)
+        width, height = -(-self.__size[0] // scale), -(-self.__size[1] // scale)
+
+        region = np.zeros((max(0, bottom - top), max(0, right - left)), dtype=np.uint8)
+        inner = (max(0, left), max(0, top), min(width, right), min(height, bottom))
+        if inner[0] >= inner[2] or inner[1] >= inner[3]:
+            return region
+
+        if level > 0:
+            source = self.__levels[level]
+            region[inner[1] - top:inner[3] - top, inner[0] - left:inner[2] - left] = \
+                source[inner[1]:inner[3], inner[0]:inner[2]]
+            return region
+
+        # Only the tiles overlapping the box are decoded
+        rows, columns = self.__tileShape
+        for row in range(inner[1] // rows, (inner[3] - 1) // rows + 1):
+            for column in range(inner[0] // columns, (inner[2] - 1) // columns + 1):
+                tile = self.tile(row * self.__grid[1] + column)
+                tile_top, tile_left = row * rows, column * columns
+                y0, y1 = max(inner[1], tile_top), min(inner[3], tile_top + tile.shape[0])
+                x0, x1 = max(inner[0], tile_left), min(inner[2], tile_left + tile.shape[1])
+                region[y0 - top:y1 - top, x0 - left:x1 - left] = tile[y0 - tile_top:y1 - tile_top,
+                                                                      x0 - tile_left:x1 - tile_left]
+        return region
+
+    def level_for(self, box: tuple, size: tuple) -> int:
+        # Coarsest level that still has at least as many pixels as the requested output
+        scale = min((box[2] - box[0]) / max(1, size[0]), (box[3] - box[1]) / max(1, size[1]))
+        if scale < 2:
+            return 0
+        return min(len(self.__levels) - 1, int(math.log2(scale)))
+
+    def region(self, box: tuple, size: tuple) -> np.ndarray:
+        # box resampled to size (width, height), read from the coarsest pyramid level that keeps the detail
+        import cv2
+
+        level = self.level_for(box, size)
+        pixels = self.read(box, level)
+        if pixels.shape[::-1] == tuple(size):
+            return pixels
+        interpolation = cv2.INTER_AREA if pixels.shape[1] > size[0] else cv2.INTER_LINEAR
+        return cv2.resize(pixels, tuple(size), interpolation=interpolation)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__tiles.clear()
+            self.__cacheUsed = 0
+        if self.__tiff is not None:
+            self.__tiff.close()
+            self.__tiff = self.__page = None
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class StageStats:
+    __slots__ = ('calls', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = 0.0
+
+    def add(self, duration: float) -> None:
+        self.calls += 1
+        self.total += duration
+        self.minimum = min(self.minimum, duration)
+        self.maximum = max(self.maximum, duration)
+
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def as_dict(self) -> dict:
+        return {'calls': self.calls, 'total': self.total, 'mean': self.mean(),
+                'min': self.minimum if self.calls else 0.0, 'max': self.maximum}
+
+
+class ProfileStats:
+    __stages: dict
+    __counters: dict
+
+    def __init__(self):
+        self.__stages = {}
+        self.__counters = {}
+
+    def add(self, name: str, duration: float) -> None:
+        stage = self.__stages.get(name)
+        if stage is None:
+            stage = self.__stages[name] = StageStats()
+        stage.add(duration)
+
+    def count(self, name: str, value: int = 1) -> int:
+        self.__counters[name] = self.__counters.get(name, 0) + value
+        return self.__counters[name]
+
+    def get_stages(self) -> dict:
+        return self.__stages
+
+    def get_counters(self) -> dict:
+        return self.__counters
+
+    def as_dict(self) -> dict:
+        return {
+            'stages': {name: stage.as_dict() for name, stage in self.__stages.items()},
+            'counters': dict(self.__counters)
+        }
+
+    def summary(self) -> str:
+        lines: list = [f'{"stage":<28} {"calls":>8} {"total ms":>11} {"mean ms":>10} {"max ms":>10}']
+        for name, stage in sorted(self.__stages.items(), key=lambda item: -item[1].total):
+            lines.append(f'{name:<28} {stage.calls:>8} {stage.total * 1e3:>11.3f} '
+                         f'{stage.mean() * 1e3:>10.3f} {stage.maximum * 1e3:>10.3f}')
+        for name, value in sorted(self.__counters.items()):
+            lines.append(f'{name:<28} {value:>8}')
+        return '\n'.join(lines)
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start)
+
+
+# Returned by every stage while profiling is off, so an instrumented block only costs an attribute test
+_DISABLED = contextlib.nullcontext()
+
+
+class Profiler:
+    MAX_EVENTS: int = 1_000_000
+
+    __enabled: bool = False
+    __stats: ProfileStats
+    __callback = None
+    __events: list
+    __trace: bool
+    __origin: float
+    __lock: threading.Lock
+
+    def __init__(self):
+        self.__stats = ProfileStats()
+        self.__events = []
+        self.__trace = False
+        self.__origin = time.perf_counter()
+        self.__lock = threading.Lock()
+
+    def enable(self, callback=None, trace: bool = False) -> None:
+        # callback(name, duration) is called after every stage, trace keeps the events for export_chrome_trace
+        self.__callback = callback
+        self.__trace = trace
+        self.__enabled = True
+
+    def disable(self) -> None:
+        self.__enabled = False
+        self.__callback = None
+
+    def is_enabled(self) -> bool:
+        return self.__enabled
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__stats = ProfileStats()
+            self.__events = []
+            self.__origin = time.perf_counter()
+
+    def get_stats(self) -> ProfileStats:
+        return self.__stats
+
+    def stage(self, name: str):
+        if not self.__enabled:
+            return _DISABLED
+        return _Stage(self, name)
+
+    def count(self, name: str, value: int = 1) -> None:
+        if not self.__enabled:
+            return
+
+        with self.__lock:
+            total = self.__stats.count(name, value)
+            if self.__trace and len(self.__events) < self.MAX_EVENTS:
+                self.__events.append((u'C', name, time.perf_counter(), total, threading.get_ident()))
+
+    def record(self, name: str, start: float, duration: float) -> None:
+        with self.__lock:
+            self.__stats.add(name, duration)
+            if self.__trace and len(self.__events) < self.MAX_EVENTS:
+                self.__events.append((u'X', name, start, duration, threading.get_ident()))
+
+        if self.__callback is not None:
+            self.__callback(name, duration)
+
+    def chrome_trace(self) -> dict:
+        # Trace event format read by chrome://tracing and Perfetto, timestamps in microseconds
+        events: list = []
+        process = os.getpid()
+        with self.__lock:
+            for phase, name, start, value, thread in self.__events:
+                event = {'name': name, 'cat': name.split('/')[0], 'ph': phase, 'pid': process, 'tid': thread,
+                         'ts': (start - self.__origin) * 1e6}
+                if phase == u'X':
+                    event['dur'] = value * 1e6
+                else:
+                    event['args'] = {name: value}
+                events.append(event)
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, filename: str) -> None:
+        with open(filename, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+
+# Shared by the classification modules, off until someone enables it
+PROFILER = Profiler()
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import collections
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from ..classification.ImageClassification import ImageClassification
+
+# Classifier owned by each worker, every worker maps the same model file read only
+_workerClassifier: ImageClassification = None
+
+
+def _initialize_worker(model_filename: str) -> None:
+    global _workerClassifier
+    _workerClassifier = ImageClassification()
+    _workerClassifier.load_model(model_filename)
+
+
+def decode(item) -> np.ndarray:
+    # Encoded files (PNG, TIFF...) arrive as bytes and are decoded like cv2.imread does, arrays as they are
+    if isinstance(item, bytes):
+        image = cv2.imdecode(np.frombuffer(item, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError(u'Could not decode the image')
+        return image
+
+    if item.ndim not in (2, 3) or min(item.shape[:2]) == 0:
+        raise ValueError(f'Expected a grey level or colour image, got shape {item.shape}')
+    return ImageClassification.to_grayscale(item)
+
+
+def _classify_items(items: list) -> list:
+    # One result dict per item, or the error message of the items that could not be read
+    outcomes: list = [None] * len(items)
+    images: list = []
+    for index, item in enumerate(items):
+        try:
+            images.append((index, decode(item)))
+        except (ValueError, cv2.error) as error:
+            outcomes[index] = str(error)
+
+    if images:
+        results = _workerClassifier.classify_batch([image for _, image in images], batch_size=len(images))
+        for (index, _), result in zip(images, results):
+            outcomes[index] = {
+                'birads': result.birads,
+                'label': result.label,
+                'distances': result.distances.tolist(),
+                'extraction_ms': result.extraction_time * 1e3,
+                'scoring_ms': result.scoring_time * 1e3
+            }
+
+    return outcomes
+
+
+class ServerMetrics:
+    WINDOW: int = 10000
+    THROUGHPUT_PERIOD: float = 60.0
+
+    __started: float
+    __requests: int
+    __errors: int
+    __batches: int
+    __batchedItems: int
+    __batchTime: float
+    __latencies: collections.deque
+    __completed: collections.deque
+
+    def __init__(self):
+        self.__started = time.perf_counter()
+        self.__requests = 0
+        self.__errors = 0
+        self.__batches = 0
+        self.__batchedItems = 0
+        self.__batchTime = 0.0
+        self.__latencies = collections.deque(maxlen=self.WINDOW)
+        self.__completed = collections.deque(maxlen=self.WINDOW)
+
+    def record_request(self, latency: float, success: bool) -> None:
+        self.__requests += 1
+        self.__errors += not success
+        self.__latencies.append(latency)
+        self.__completed.append(time.perf_counter())
+
+    def record_batch(self, size: int, duration: float) -> None:
+        self.__batches += 1
+        self.__batchedItems += size
+        self.__batchTime += duration
+
+    def as_dict(self, queued: int = 0) -> dict:
+        now = time.perf_counter()
+        uptime = now - self.__started
+        recent = sum(1 for completed in self.__completed if now - completed <= self.THROUGHPUT_PERIOD)
+        latencies = np.array(self.__latencies) * 1e3 if self.__latencies else np.zeros(1)
+
+        return {
+            'uptime_s': uptime,
+            'requests': self.__requests,
+            'errors': self.__errors,
+            'queued': queued,
+            'batches': self.__batches,
+            'mean_batch_size': self.__batchedItems / max(1, self.__batches),
+            'mean_batch_ms': self.__batchTime / max(1, self.__batches) * 1e3,
+            'throughput_per_s': self.__requests / max(uptime, 1e-9),
+            'recent_throughput_per_s': recent / min(self.THROUGHPUT_PERIOD, max(uptime, 1e-9)),
+            'latency_ms': {
+                'mean': float(latencies.mean()),
+                'p50': float(np.percentile(latencies, 50)),
+                'p95': float(np.percentile(latencies, 95)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(latencies.max())
+            }
+        }
+
+
+class MicroBatcher:
+    __executor: Executor
+    __function = None
+    __maxBatch: int
+    __maxWait: float
+    __concurrency: int
+    __metrics: ServerMetrics
+    __queue: asyncio.Queue = None
+
+    def __init__(self, executor: Executor, function, max_batch: int = 32, max_wait: float = 0.005,
+                 concurrency: int = 1, metrics: ServerMetrics = None):
+        self.__executor = executor
+        self.__function = function
+        self.__maxBatch = max(1, max_batch)
+        self.__maxWait = max_wait
+        self.__concurrency = max(1, concurrency)
+        self.__metrics = metrics if metrics is not None else ServerMetrics()
+
+    def get_queued(self) -> int:
+        return self.__queue.qsize() if self.__queue is not None else 0
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((item, future))
+        return await future
+
+    async def run(self) -> None:
+        self.__queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.__concurrency)
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # A batch only starts collecting once a worker is free, so requests arriving while every worker is busy
+            # pile up and leave together: batches grow with the load, an idle server answers after max_wait at most
+            await slots.acquire()
+            batch: list = [await self.__queue.get()]
+            deadline = loop.time() + self.__maxWait
+
+            while len(batch) < self.__maxBatch:
+                if not self.__queue.empty():
+                    batch.append(self.__queue.get_nowait())
+                    continue
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.__queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            loop.create_task(self.dispatch(batch, slots))
+
+    async def dispatch(self, batch: list, slots: asyncio.Semaphore) -> None:
+        start = time.perf_counter()
+        try:
+            outcomes = await asyncio.get_running_loop().run_in_executor(self.__executor, self.__function,
+                                                                        [item for item, _ in batch])
+        except Exception as error:
+            # A crashed worker fails every request of its batch, not the server
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            slots.release()
+
+        self.__metrics.record_batch(len(batch), time.perf_counter() - start)
+        for (_, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+
+class InferenceServer:
+    MAX_BODY: int = 64 * 1024 * 1024
+    REASONS: dict = {200: u'OK', 400: u'Bad Request', 404: u'Not Found', 405: u'Method Not Allowed',
+                     413: u'Payload Too Large', 422: u'Unprocessable Entity', 500: u'Internal Server Error'}
+
+    __modelFilename: str
+    __workers: int
+    __executor: Executor = None
+    __batcher: MicroBatcher
+    __metrics: ServerMetrics
+    __server: asyncio.AbstractServer = None
+
+    def __init__(self, model_filename: str, workers: int = 1, max_batch: int = 32, max_wait: float = 0.005):
+        self.__modelFilename = model_filename
+        self.__workers = workers if workers is not None else os.cpu_count() or 1
+        self.__metrics = ServerMetrics()
+
+        if self.__workers > 0:
+            # Spawned like the feature extraction pool, each worker loads the model once
+            self.__executor = ProcessPoolExecutor(max_workers=self.__workers,
+                                                  mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=_initialize_worker, initargs=(model_filename,))
+        else:
+            # No worker process: batches run on one thread of this process
+            _initialize_worker(model_filename)
+            self.__executor = ThreadPoolExecutor(max_workers=1)
+
+        self.__batcher = MicroBatcher(self.__executor, _classify_items, max_batch, max_wait,
+                                      max(1, self.__workers), self.__metrics)
+
+    def get_metrics(self) -> dict:
+        return self.__metrics.as_dict(self.__batcher.get_queued())
+
+    async def start(self, host: str = u'127.0.0.1', port: int = 8080, unix_path: str = None) -> asyncio.AbstractServer:
+        asyncio.get_running_loop().create_task(self.__batcher.run())
+
+        # Workers are started and the model loaded before the first request instead of during it
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(self.__executor, time.sleep, 0.01)
+                               for _ in range(max(1, self.__workers))))
+
+        if unix_path is not None:
+            self.__server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            self.__server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.__server
+
+    async def serve(self, host: str = u'127.0.0.1', port: int = 8080, unix_path: str = None, ready=None) -> None:
+        server = await self.start(host, port, unix_path)
+        if ready is not None:
+            ready()
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+        if self.__executor is not None:
+            self.__executor.shutdown(cancel_futures=True)
+            self.__executor = None
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Minimal HTTP/1.1 with keep alive: request line, headers, Content-Length body
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, version = request_line.decode(u'latin-1').rstrip(u'\r\n').split(u' ', 2)
+                headers: dict = {}
+                while True:
+                    line = (await reader.readline()).decode(u'latin-1').rstrip(u'\r\n')
+                    if not line:
+                        break
+                    name, _, value = line.partition(u':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get(u'content-length', 0))
+                if length > self.MAX_BODY:
+                    await self.respond(writer, 413, {'error': f'Body larger than {self.MAX_BODY} bytes'}, False)
+                    break
+
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.handle_request(method, path.split(u'?')[0], headers, body)
+
+                keep_alive = headers.get(u'connection', u'').lower() != u'close' and version == u'HTTP/1.1'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool) -> None:
+        body = json.dumps(payload).encode(u'utf-8')
+        writer.write(f'HTTP/1.1 {status} {self.REASONS.get(status, u"")}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: {u"keep-alive" if keep_alive else u"close"}\r\n\r\n'.encode(u'latin-1') + body)
+        await writer.drain()
+
+    async def handle_request(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if path == u'/health':
+            return 200, {'status': u'ok'}
+
+        if path == u'/metrics':
+            return 200, self.get_metrics()
+
+        if path != u'/classify':
+            return 404, {'error': f'Unknown path {path}'}
+        if method != u'POST':
+            return 405, {'error': u'Use POST with the image in the body'}
+
+        start = time.perf_counter()
+        try:
+            item = self.parse_body(headers, body)
+        except (ValueError, TypeError) as error:
+            self.__metrics.record_request(time.perf_counter() - start, False)
+            return 400, {'error': str(error)}
+
+        try:
+            outcome = await self.__batcher.submit(item)
+        except Exception as error:
+            self.__metrics.record_request(time.perf_counter() - start, False)
+            return 500, {'error': f'Classification failed: {error}'}
+
+        latency = time.perf_counter() - start
+        self.__metrics.record_request(latency, isinstance(outcome, dict))
+
+        if not isinstance(outcome, dict):
+            return 422, {'error': outcome}
+        outcome['latency_ms'] = latency * 1e3
+        return 200, outcome
+
+    @staticmethod
+    def parse_body(headers: dict, body: bytes):
+        # application/x-npy: a .npy array; application/octet-stream with X-Shape (rows,columns) and optional X-Dtype
+        # (uint8 or uint16): raw pixels; anything else: an encoded image file
+        if not body:
+            raise ValueError(u'Empty body')
+
+        content_type = headers.get(u'content-type', u'').split(u';')[0].strip().lower()
+        if content_type == u'application/x-npy':
+            array = np.load(io.BytesIO(body), allow_pickle=False)
+            if not ImageClassification.is_grey_dtype(array.dtype):
+                raise ValueError(f'Unsupported dtype {array.dtype}, send uint8 or uint16 pixels')
+            return array
+
+        if content_type == u'application/octet-stream' and u'x-shape' in headers:
+            shape = tuple(int(value) for value in headers[u'x-shape'].split(u','))
+            try:
+                dtype = np.dtype(headers.get(u'x-dtype', u'uint8'))
+            except TypeError:
+                raise ValueError(f'Unknown X-Dtype {headers[u"x-dtype"]}')
+            if not ImageClassification.is_grey_dtype(dtype):
+                raise ValueError(f'Unsupported X-Dtype {dtype}, send uint8 or uint16 pixels')
+            if int(np.prod(shape)) * dtype.itemsize != len(body):
+                raise ValueError(f'Body of {len(body)} bytes does not hold a {shape} {dtype} array')
+            return np.frombuffer(body, dtype=dtype).reshape(shape)
+
+        return body
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    # Emitted from the pool thread, delivered on the thread that owns the receivers (the interface)
+    progress = Signal(int, int, float)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class BackgroundTask(QRunnable):
+    # Reports are turned into at most this many progress signals per second, so the event loop is never flooded
+    REPORTS_PER_SECOND: int = 20
+
+    signals: TaskSignals
+
+    __function = None
+    __cancelEvent: threading.Event
+    __started: float
+    __lastReport: float
+
+    def __init__(self, function):
+        # function(task) runs on the pool, it calls task.report(done, total) as it goes and returns the result
+        super().__init__()
+        self.signals = TaskSignals()
+        self.__function = function
+        self.__cancelEvent = threading.Event()
+        self.__started = time.perf_counter()
+        self.__lastReport = 0.0
+
+    def cancel(self) -> None:
+        self.__cancelEvent.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelEvent.is_set()
+
+    def report(self, done: int, total: int) -> None:
+        # Also the cancellation point: the running function stops at its next report
+        if self.__cancelEvent.is_set():
+            raise TaskCancelled()
+
+        now = time.perf_counter()
+        if done < total and now - self.__lastReport < 1.0 / self.REPORTS_PER_SECOND:
+            return
+        self.__lastReport = now
+
+        # Seconds left at the mean rate so far, negative while unknown
+        elapsed = now - self.__started
+        eta = elapsed / done * (total - done) if done > 0 else -1.0
+        self.signals.progress.emit(done, total, eta)
+
+    def run(self) -> None:
+        self.__started = time.perf_counter()
+        try:
+            result = self.__function(self)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as error:
+            self.signals.failed.emit(str(error) or type(error).__name__)
+        else:
+            if self.__cancelEvent.is_set():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
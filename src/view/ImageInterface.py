@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 
-from PIL.ImageQt import ImageQt
+from typing import TYPE_CHECKING
+
 from PySide6 import QtCore
-from PySide6.QtCore import QRect, QMetaObject, QCoreApplication
-from PySide6.QtGui import QPixmap, QAction, QPainter, QPen, QImage, QMouseEvent, QPaintEvent, QPalette
+from PySide6.QtCore import QRect, QMetaObject, QCoreApplication, QThreadPool, QTimer, Signal
+from PySide6.QtGui import QPixmap, QAction, QPainter, QPen, QMouseEvent, QPaintEvent, QPalette, QKeySequence
 from PySide6.QtWidgets import QLabel, QPushButton, QWidget, QMenuBar, QButtonGroup, QFrame, QMenu, QMainWindow, \
-    QFileDialog, QComboBox, QMessageBox, QRadioButton, QScrollArea, QVBoxLayout
+    QFileDialog, QComboBox, QMessageBox, QRadioButton, QScrollArea, QVBoxLayout, QProgressBar, QCheckBox
 
-from ..classification.ImageClassification import ImageClassification
 from ..handler.ImageHandler import ImageHandler
+from .BackgroundTask import BackgroundTask
+from .PixmapCache import PixmapCache
+
+# The classifier pulls in OpenCV and SciPy, it is only imported once a classifier is trained or loaded so the
+# window shows up without waiting for them
+if TYPE_CHECKING:
+    from ..classification.ImageClassification import ImageClassification
 
 
 class ImageInterface(QMainWindow):
@@ -52,22 +59,47 @@ class ImageInterface(QMainWindow):
     __actionQuit: QAction
     __actionOpenImage: QAction
     __actionCloseImage: QAction
+    __actionUndo: QAction
+    __actionRedo: QAction
 
     __actionTrainClassifier: QAction
+    __actionLoadModel: QAction
+    __actionSaveModel: QAction
+    __actionDensityMap: QAction
 
     # Menu
     __menuBar: QMenuBar
     __menuFile: QMenu
+    __menuEdit: QMenu
     __menuClassifier: QMenu
     # __subMenuSelectFilter: QMenu
 
     # Wrapper to image handler
-    __imageModified: ImageQt = None
-    __imageContainer: ImageQt = None
     __imageHandler: ImageHandler = None
 
+    # Pixmaps of the views already shown, keyed by image, operations and zoom
+    __pixmaps: PixmapCache
+
     # Classifier
-    __classifier: ImageClassification
+    __classifier: 'ImageClassification' = None
+
+    # Training and classification run on the pool, one task at a time
+    __taskPool: QThreadPool
+    __task: BackgroundTask = None
+    __taskName: str = None
+    __taskUnit: str = None
+    __progressBar: QProgressBar
+    __cancelTaskButton: QPushButton
+
+    # Live readout of the selection box. Mouse moves are coalesced by the timer, the box is scored on a thread of its
+    # own and while it is busy only the latest box waits, older ones are dropped
+    LIVE_INTERVAL: int = 16
+    __liveCheckBox: QCheckBox
+    __liveLabel: QLabel
+    __liveTimer: QTimer
+    __livePool: QThreadPool
+    __liveTask: BackgroundTask = None
+    __livePending = None
 
     __imageLabel: QLabel
     __imageWidget: QWidget = None
@@ -77,6 +109,7 @@ class ImageInterface(QMainWindow):
         # Configure interface
         super().__init__()
         self.setObjectName(u'ImagePy')
+        self.__pixmaps = PixmapCache()
         self.resize(1366, 786)
         self.setMouseTracking(True)
 
@@ -119,15 +152,37 @@ class ImageInterface(QMainWindow):
         self.__actionQuit = QAction(self)
         self.__actionOpenImage = QAction(self)
         self.__actionCloseImage = QAction(self)
+        self.__actionUndo = QAction(self)
+        self.__actionRedo = QAction(self)
 
         self.__actionTrainClassifier = QAction(self)
+        self.__actionLoadModel = QAction(self)
+        self.__actionSaveModel = QAction(self)
+        self.__actionDensityMap = QAction(self)
 
         self.__menuBar = QMenuBar(self)
         self.__menuFile = QMenu(self.__menuBar)
+        self.__menuEdit = QMenu(self.__menuBar)
         self.__menuClassifier = QMenu(self.__menuBar)
 
         self.__imageLabel = ZoomLabel(self.__imageWidget, alignment=QtCore.Qt.AlignCenter)
 
+        self.__taskPool = QThreadPool(self)
+        self.__taskPool.setMaxThreadCount(1)
+        self.__progressBar = QProgressBar(self)
+        self.__progressBar.setVisible(False)
+        self.__cancelTaskButton = QPushButton(self)
+        self.__cancelTaskButton.setVisible(False)
+
+        self.__liveCheckBox = QCheckBox(self)
+        self.__liveCheckBox.setVisible(False)
+        self.__liveLabel = QLabel(self)
+        self.__liveTimer = QTimer(self)
+        self.__liveTimer.setSingleShot(True)
+        self.__liveTimer.setInterval(self.LIVE_INTERVAL)
+        self.__livePool = QThreadPool(self)
+        self.__livePool.setMaxThreadCount(1)
+
         # Init interface
         self.setup_ui()
 
@@ -150,28 +205,27 @@ class ImageInterface(QMainWindow):
         if self.__imageHandler is None:
             return
 
-        elif self.__containerImagePixmap is None or self.__can_update:
-            q_image: QImage = self.__imageHandler.get_qt_image(original=False)
-            self.__containerImagePixmap = QPixmap.fromImage(q_image)
+        # Views shown before, such as the original after a reset or an undone operation, are not rendered again
+        handler: ImageHandler = self.__imageHandler
+        pixmap: QPixmap = self.__pixmaps.pixmap(handler.get_view_key(), handler.get_image)
+        if pixmap is not self.__containerImagePixmap or self.__can_update:
+            self.__containerImagePixmap = pixmap
             self.__imageLabel.setPixmap(self.__containerImagePixmap)
             self.__can_update = False
-
-        elif self.__containerImagePixmap is not None \
-                and self.__imageModified is not None \
-                and self.__imageModified != self.__imageHandler.get_image():
-            q_image: QImage = self.__imageHandler.get_qt_image(original=False)
-            self.__containerImagePixmap = QPixmap.fromImage(q_image)
-            self.__imageLabel.setPixmap(self.__containerImagePixmap)
+            self.live_moved()
 
     def recover_original_image(self) -> None:
         try:
-            self.__containerImagePixmap = QPixmap.fromImage(self.__imageHandler.get_qt_image(original=True))
-            self.__imageLabel.setPixmap(self.__containerImagePixmap)
+            self.__imageHandler.reset()
+            self.load_image()
         except AttributeError:
             return
 
     def close_image(self) -> None:
         self.__imageHandler = None
+        self.__pixmaps.clear()
+        self.__livePending = None
+        self.__liveLabel.clear()
         self.__imageLabel.setPixmap(None)
         del self.__imageHandler
 
@@ -180,36 +234,49 @@ class ImageInterface(QMainWindow):
 
     def zoom_out(self) -> None:
         try:
-            self.__imageModified = ImageQt(self.__imageHandler.zoom_out())
+            self.__imageHandler.zoom_out()
             self.load_image()
         except AttributeError:
             return
 
     def zoom_in(self) -> None:
         try:
-            zoom_image: ImageHandler = self.__imageHandler.zoom_in(self.__imageLabel.get_initial_point())
-            self.__imageModified = ImageQt(zoom_image)
+            self.__imageHandler.zoom_in(self.__imageLabel.get_initial_point())
+            self.load_image()
+        except AttributeError:
+            return
+
+    def undo(self) -> None:
+        try:
+            self.__imageHandler.undo()
+            self.load_image()
+        except AttributeError:
+            return
+
+    def redo(self) -> None:
+        try:
+            self.__imageHandler.redo()
             self.load_image()
         except AttributeError:
             return
 
     def decrease_to_64(self) -> None:
         try:
-            self.__imageModified = ImageQt(self.__imageHandler.new_resolution(64))
+            self.__imageHandler.new_resolution(64)
             self.load_image()
         except AttributeError:
             return
 
     def decrease_to_32(self) -> None:
         try:
-            self.__imageModified = ImageQt(self.__imageHandler.new_resolution(32))
+            self.__imageHandler.new_resolution(32)
             self.load_image()
         except AttributeError:
             return
 
     def equalize(self) -> None:
         try:
-            self.__imageModified = ImageQt(self.__imageHandler.equalize())
+            self.__imageHandler.equalize()
             self.load_image()
         except AttributeError:
             return
@@ -217,36 +284,209 @@ class ImageInterface(QMainWindow):
     def change_gray_scale(self) -> None:
         try:
             scale: int = int(self.__comboboxGrayScale.currentText())
-            self.__imageModified = ImageQt(self.__imageHandler.gray_scale(scale))
+            self.__imageHandler.gray_scale(scale)
             self.load_image()
         except AttributeError:
             return
 
+    def start_task(self, name: str, function, finished, unit: str = u'images', cancellable: bool = True) -> bool:
+        # function(task) runs on the pool, finished(result) back on this thread. Cancel is only offered when the
+        # function reports, its reports are where it stops
+        if self.__task is not None:
+            self.statusBar().showMessage(f'{self.__taskName} is still running', 3000)
+            return False
+
+        self.__task = BackgroundTask(function)
+        self.__taskName = name
+        self.__taskUnit = unit
+        self.__task.signals.progress.connect(self.task_progress)
+        self.__task.signals.finished.connect(finished)
+        self.__task.signals.finished.connect(self.task_done)
+        self.__task.signals.failed.connect(self.task_failed)
+        self.__task.signals.cancelled.connect(self.task_cancelled)
+
+        self.__progressBar.setRange(0, 0)
+        self.__progressBar.setVisible(True)
+        self.__cancelTaskButton.setVisible(cancellable)
+        self.statusBar().showMessage(f'{name}...')
+        self.__taskPool.start(self.__task)
+        return True
+
+    def task_progress(self, done: int, total: int, eta: float) -> None:
+        self.__progressBar.setRange(0, total)
+        self.__progressBar.setValue(done)
+        remaining: str = f', {int(eta) // 60}:{int(eta) % 60:02} left' if eta >= 0 else u''
+        self.statusBar().showMessage(f'{self.__taskName}: {done}/{total} {self.__taskUnit}{remaining}')
+
+    def task_done(self, *_) -> None:
+        self.__task = None
+        self.__progressBar.setVisible(False)
+        self.__cancelTaskButton.setVisible(False)
+        self.statusBar().clearMessage()
+
+    def task_failed(self, message: str) -> None:
+        name: str = self.__taskName
+        self.task_done()
+        QMessageBox.warning(self, name, message)
+
+    def task_cancelled(self) -> None:
+        name: str = self.__taskName
+        self.task_done()
+        self.statusBar().showMessage(f'{name} cancelled', 3000)
+
+    def cancel_task(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            self.statusBar().showMessage(f'Cancelling {self.__taskName}...')
+
+    def closeEvent(self, event) -> None:
+        # A running task stops at its next progress report
+        self.cancel_task()
+        self.__livePending = None
+        self.__taskPool.waitForDone()
+        self.__livePool.waitForDone()
+        super().closeEvent(event)
+
+    def toggle_live(self, checked: bool) -> None:
+        if checked:
+            self.live_update()
+        else:
+            self.__livePending = None
+            self.__liveLabel.clear()
+
+    def live_moved(self, *_) -> None:
+        # Throttled rather than debounced, the readout keeps following a box that never stops moving
+        if self.__liveCheckBox.isChecked() and not self.__liveTimer.isActive():
+            self.__liveTimer.start()
+
+    def live_update(self) -> None:
+        if self.__classifier is None or self.__imageHandler is None or not self.__liveCheckBox.isChecked():
+            return
+
+        # The box is read here, through the view pipeline this thread owns, as Classify Image reads it. Features
+        # and distances are computed on the pool
+        pixels = self.__imageHandler.roi(self.__imageLabel.get_initial_point())
+        if self.__liveTask is not None:
+            self.__livePending = pixels
+            return
+        self.start_live(pixels)
+
+    def start_live(self, pixels) -> None:
+        classifier: 'ImageClassification' = self.__classifier
+        self.__liveTask = BackgroundTask(lambda task: classifier.readout(classifier.classify_array(pixels)))
+        self.__liveTask.signals.finished.connect(self.live_finished)
+        self.__liveTask.signals.failed.connect(self.live_finished)
+        self.__livePool.start(self.__liveTask)
+
+    def live_finished(self, text: str) -> None:
+        self.__liveTask = None
+        if self.__liveCheckBox.isChecked():
+            self.__liveLabel.setText(text)
+        if self.__livePending is not None:
+            pixels, self.__livePending = self.__livePending, None
+            self.start_live(pixels)
+
     def train_classifier(self) -> None:
         dataset: str = QFileDialog.getExistingDirectory(self, u'Select Dataset folder', u'')
+        if not dataset:
+            return
 
-        self.__classifier = ImageClassification()
-        self.__classifier.load_images(dataset)
-        self.__classifier.train()
+        def train(task: BackgroundTask) -> 'ImageClassification':
+            # Extraction goes to worker processes, this thread only waits on them and reports progress. Even the
+            # first import of the classifier happens here
+            from ..classification.ImageClassification import ImageClassification
 
+            classifier = ImageClassification(workers=None)
+            classifier.set_progress(task.report)
+            classifier.load_images(dataset)
+            classifier.train()
+            classifier.set_progress(None)
+            return classifier
+
+        self.start_task(u'Training', train, self.training_finished)
+
+    def training_finished(self, classifier: 'ImageClassification') -> None:
+        self.__classifier = classifier
         self.__classifyImageButton.setVisible(True)
         self.__classifierRadioButton.setVisible(True)
+        self.__liveCheckBox.setVisible(True)
 
         msg_box: QMessageBox = QMessageBox(self)
         msg_box.setWindowTitle(u'Classifier Result')
         msg_box.setText(self.__classifier.show_confusion_matrix())
         msg_box.exec_()
 
+    def load_model(self) -> None:
+        file_name: tuple = QFileDialog.getOpenFileName(self, u'Load Model', u'', u'Classifier model (*.model)')
+        if not file_name[0]:
+            return
+
+        from ..classification.ImageClassification import ImageClassification
+
+        classifier: ImageClassification = ImageClassification()
+        try:
+            classifier.load_model(file_name[0])
+        except (OSError, ValueError) as error:
+            QMessageBox.warning(self, u'Load Model', str(error))
+            return
+
+        self.__classifier = classifier
+        self.__classifyImageButton.setVisible(True)
+        self.__classifierRadioButton.setVisible(True)
+        self.__liveCheckBox.setVisible(True)
+
+    def save_model(self) -> None:
+        if self.__classifier is None:
+            return
+
+        file_name: tuple = QFileDialog.getSaveFileName(self, u'Save Model', u'', u'Classifier model (*.model)')
+        if not file_name[0]:
+            return
+
+        self.__classifier.save_model(file_name[0] if file_name[0].endswith(u'.model') else file_name[0] + u'.model')
+
+    def show_density_map(self) -> None:
+        if self.__classifier is None or self.__imageHandler is None:
+            return
+
+        classifier: 'ImageClassification' = self.__classifier
+        handler: ImageHandler = self.__imageHandler
+
+        def map_density(task: BackgroundTask) -> tuple:
+            image = handler.get_array(original=True)
+            task.report(0, 1)
+            return handler, classifier.density_map(image, progress=task.report)
+
+        self.start_task(u'Density map', map_density, self.density_map_finished, unit=u'rows')
+
+    def density_map_finished(self, result: tuple) -> None:
+        handler, density_map = result
+        if density_map.labels.size == 0 or handler is not self.__imageHandler:
+            return
+
+        overlay = handler.density_overlay(density_map.labels, density_map.window, density_map.stride)
+        self.__containerImagePixmap = PixmapCache.to_pixmap(overlay)
+        self.__imageLabel.setPixmap(self.__containerImagePixmap)
+
     def classify_image(self) -> None:
+        if self.__classifier is None or self.__imageHandler is None:
+            return
+
         self.__can_classify_full_image = not self.__classifierRadioButton.isChecked()
+        classifier: 'ImageClassification' = self.__classifier
+        handler: ImageHandler = self.__imageHandler
 
-        if self.__can_classify_full_image:
-            self.__imageHandler.get_image(original=True).save(u'image/image.png')
-        else:
-            self.__imageHandler.zoom_in(self.__imageLabel.get_initial_point()).save(u'image/image.png')
-            self.__imageHandler.zoom_out()
+        # The region comes from the view pipeline, which belongs to this thread. The whole image is read on the pool
+        pixels = None if self.__can_classify_full_image else handler.roi(self.__imageLabel.get_initial_point())
+
+        def classify(task: BackgroundTask) -> str:
+            image = handler.get_array(original=True) if pixels is None else pixels
+            return classifier.describe(classifier.classify_array(image))
 
-        result: str = self.__classifier.classify_single_image(u'image/image.png')
+        # A single feature extraction, nothing to stop in between
+        self.start_task(u'Classification', classify, self.classification_finished, cancellable=False)
+
+    def classification_finished(self, result: str) -> None:
         msg_box: QMessageBox = QMessageBox(self)
         msg_box.setWindowTitle(u'Classifier Result')
         msg_box.setText(result)
@@ -262,12 +502,29 @@ class ImageInterface(QMainWindow):
         self.__actionCloseImage.setObjectName(u'&__actionCloseImage')
         self.__actionCloseImage.triggered.connect(self.close_image)
 
+        self.__actionUndo.setObjectName(u'&__actionUndo')
+        self.__actionUndo.setShortcut(QKeySequence.Undo)
+        self.__actionUndo.triggered.connect(self.undo)
+
+        self.__actionRedo.setObjectName(u'&__actionRedo')
+        self.__actionRedo.setShortcut(QKeySequence.Redo)
+        self.__actionRedo.triggered.connect(self.redo)
+
         self.__actionQuit.setObjectName(u'&__actionQuit')
         self.__actionQuit.triggered.connect(self.close)
 
         self.__actionTrainClassifier.setObjectName(u'&__actionTrainClassifier')
         self.__actionTrainClassifier.triggered.connect(self.train_classifier)
 
+        self.__actionLoadModel.setObjectName(u'&__actionLoadModel')
+        self.__actionLoadModel.triggered.connect(self.load_model)
+
+        self.__actionSaveModel.setObjectName(u'&__actionSaveModel')
+        self.__actionSaveModel.triggered.connect(self.save_model)
+
+        self.__actionDensityMap.setObjectName(u'&__actionDensityMap')
+        self.__actionDensityMap.triggered.connect(self.show_density_map)
+
         self.__imageWidget.setObjectName(u'&__imageWidget')
 
         self.__imageManipulationGroup.setObjectName(u'&__imageManipulationGroup')
@@ -346,11 +603,30 @@ class ImageInterface(QMainWindow):
             QRect(self.__columnDefaultPositionButton + self.__buttonPlace + self.__widthButton + 15,
                   self.__rowPositionButton + 22, 120, self.__heightButton - 2))
 
+        self.__liveCheckBox.setObjectName(u'&__liveCheckBox')
+        self.__liveCheckBox.setGeometry(
+            QRect(self.__columnDefaultPositionButton + self.__buttonPlace + self.__widthButton + 15,
+                  self.__rowPositionButton, 120, self.__heightButton - 2))
+        self.__liveCheckBox.toggled.connect(self.toggle_live)
+        self.__liveTimer.timeout.connect(self.live_update)
+
+        self.__liveLabel.setObjectName(u'&__liveLabel')
+        self.statusBar().addPermanentWidget(self.__liveLabel)
+
+        self.__progressBar.setObjectName(u'&__progressBar')
+        self.__progressBar.setMaximumWidth(240)
+        self.statusBar().addPermanentWidget(self.__progressBar)
+
+        self.__cancelTaskButton.setObjectName(u'&__cancelTaskButton')
+        self.__cancelTaskButton.clicked.connect(self.cancel_task)
+        self.statusBar().addPermanentWidget(self.__cancelTaskButton)
+
         self.__imageLabel.setObjectName(u'&__imageLabel')
         self.__imageLabel.setGeometry(
             QRect(self.__imageLabelColumn, self.__imageLabelRow, self.__imageLabelWidth, self.__imageLabelHeight))
         self.__imageLabel.setFrameShape(QFrame.StyledPanel)
         self.__imageLabel.setFrameShadow(QFrame.Raised)
+        self.__imageLabel.moved.connect(self.live_moved)
 
         self.setCentralWidget(self.__imageWidget)
 
@@ -368,8 +644,16 @@ class ImageInterface(QMainWindow):
         self.__menuFile.addAction(self.__actionCloseImage)
         self.__menuFile.addAction(self.__actionQuit)
 
+        self.__menuEdit.setObjectName(u'&__menuEdit')
+        self.__menuBar.addAction(self.__menuEdit.menuAction())
+        self.__menuEdit.addAction(self.__actionUndo)
+        self.__menuEdit.addAction(self.__actionRedo)
+
         self.__menuBar.addAction(self.__menuClassifier.menuAction())
         self.__menuClassifier.addAction(self.__actionTrainClassifier)
+        self.__menuClassifier.addAction(self.__actionLoadModel)
+        self.__menuClassifier.addAction(self.__actionSaveModel)
+        self.__menuClassifier.addAction(self.__actionDensityMap)
 
         self.translate_ui()
 
@@ -384,8 +668,15 @@ class ImageInterface(QMainWindow):
         self.__actionCloseImage.setText(QCoreApplication.translate('MainWindow', u'Close Image', None))
         self.__actionQuit.setText(QCoreApplication.translate('MainWindow', u'Quit', None))
 
+        self.__menuEdit.setTitle(QCoreApplication.translate('MainWindow', u'Edit', None))
+        self.__actionUndo.setText(QCoreApplication.translate('MainWindow', u'Undo', None))
+        self.__actionRedo.setText(QCoreApplication.translate('MainWindow', u'Redo', None))
+
         self.__menuClassifier.setTitle(QCoreApplication.translate('MainWindow', u'Classifier', None))
         self.__actionTrainClassifier.setText(QCoreApplication.translate('MainWindow', u'Train from dataset...', None))
+        self.__actionLoadModel.setText(QCoreApplication.translate('MainWindow', u'Load model...', None))
+        self.__actionSaveModel.setText(QCoreApplication.translate('MainWindow', u'Save model...', None))
+        self.__actionDensityMap.setText(QCoreApplication.translate('MainWindow', u'Density map', None))
 
         self.__resize64x64Button.setText(QCoreApplication.translate('MainWindow', u'64x64', None))
         self.__resize32x32Button.setText(QCoreApplication.translate('MainWindow', u'32x32', None))
@@ -395,9 +686,14 @@ class ImageInterface(QMainWindow):
         self.__zoomInButton.setText(QCoreApplication.translate('MainWindow', u'Zoom In', None))
         self.__zoomOutButton.setText(QCoreApplication.translate('MainWindow', u'Zoom Out', None))
         self.__classifyImageButton.setText(QCoreApplication.translate('MainWindow', u'Classify Image', None))
+        self.__cancelTaskButton.setText(QCoreApplication.translate('MainWindow', u'Cancel', None))
+        self.__liveCheckBox.setText(QCoreApplication.translate('MainWindow', u'Live readout', None))
 
 
 class ZoomLabel(QLabel):
+    # Top left corner of the selection box, every time it moves
+    moved = Signal(int, int)
+
     __x: int = 0
     __y: int = 0
     __flag: bool = False
@@ -410,6 +706,7 @@ class ZoomLabel(QLabel):
         self.__x = (event.x() - 64)
         self.__y = (event.y() - 64)
         self.update()
+        self.moved.emit(self.__x, self.__y)
 
     def mouseReleaseEvent(self, event: QPaintEvent) -> None:
         self.__flag = False
@@ -419,6 +716,7 @@ class ZoomLabel(QLabel):
             self.__x = (event.x() - 64)
             self.__y = (event.y() - 64)
             self.update()
+            self.moved.emit(self.__x, self.__y)
 
     def paintEvent(self, event: QPaintEvent) -> None:
         super().paintEvent(event)
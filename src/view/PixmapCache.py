@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+import numpy as np
+from PySide6.QtGui import QImage, QPixmap
+
+
+class PixmapCache:
+    # Bytes of pixmaps kept, a 1280x720 view takes about 3.5 MiB once uploaded
+    BUDGET: int = 64 * 2 ** 20
+
+    __pixmaps: OrderedDict
+    __used: int
+    __hits: int
+    __misses: int
+
+    def __init__(self):
+        self.__pixmaps = OrderedDict()
+        self.__used = 0
+        self.__hits = 0
+        self.__misses = 0
+
+    @staticmethod
+    def to_array(image) -> np.ndarray:
+        # Grey or RGB 8 bit pixels, palette images (quantized views) are looked up to grey first
+        if isinstance(image, np.ndarray):
+            return image
+        if image.mode not in ('L', 'RGB', 'RGBA'):
+            image = image.convert('RGB' if image.mode == 'P' and image.palette.mode != 'L' else 'L')
+        return np.asarray(image)
+
+    @staticmethod
+    def to_qimage(pixels: np.ndarray) -> QImage:
+        # The QImage reads the array memory directly, the caller keeps the array alive for as long as the image
+        pixels = np.ascontiguousarray(pixels)
+        height, width = pixels.shape[:2]
+        if pixels.ndim == 2:
+            image_format = QImage.Format_Grayscale8
+        elif pixels.shape[2] == 3:
+            image_format = QImage.Format_RGB888
+        else:
+            image_format = QImage.Format_RGBA8888
+        return QImage(pixels.data, width, height, pixels.strides[0], image_format)
+
+    @classmethod
+    def to_pixmap(cls, image) -> QPixmap:
+        pixels = cls.to_array(image)
+        # fromImage copies into the pixmap, after that the array is no longer needed
+        return QPixmap.fromImage(cls.to_qimage(pixels))
+
+    def pixmap(self, key, render) -> QPixmap:
+        # render() gives the PIL image or array of the view when key is not cached yet
+        pixmap = self.__pixmaps.get(key)
+        if pixmap is not None:
+            self.__pixmaps.move_to_end(key)
+            self.__hits += 1
+            return pixmap
+
+        self.__misses += 1
+        pixmap = self.to_pixmap(render())
+        self.__pixmaps[key] = pixmap
+        self.__used += self.size(pixmap)
+        while self.__used > self.BUDGET and len(self.__pixmaps) > 1:
+            _, released = self.__pixmaps.popitem(last=False)
+            self.__used -= self.size(released)
+        return pixmap
+
+    @staticmethod
+    def size(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def get_statistics(self) -> dict:
+        return {'hits': self.__hits, 'misses': self.__misses, 'pixmaps': len(self.__pixmaps), 'bytes': self.__used}
+
+    def clear(self) -> None:
+        self.__pixmaps.clear()
+        self.__used = 0